@@ -1,25 +1,32 @@
 import os
 import pandas as pd
-import spacy
-import stanza 
 import sys
+import time
 
-'''Get lemmas and part-of-speech tags of a sentence using a model,
-spaCy or Stanza (StanfordNLP).
+from annotation_cache import normalize_sentence
+
+# spaCy and Stanza are slow to import, they are imported when a model is loaded
+
+
+'''True if model is a Stanza (StanfordNLP) pipeline, False for spaCy models.
 '''
-def process_sentence(model,sentence):
+def is_stanza(model):
+    return type(model).__module__.startswith("stanza")
+
+
+'''Read lemmas and part-of-speech tags off a model annotation,
+spaCy Doc or Stanza (StanfordNLP) Document.
+'''
+def read_annotation(annotation):
     lemmas = []
     tags = []
-    # generate model annotation of sentence and
-    # retrieve lemma and POS tag for each word
-    annotation = model(sentence)
-    # method for stanza models
-    if type(model) == stanza.pipeline.core.Pipeline:
+    # method for stanza documents
+    if is_stanza(annotation):
         for sentence in annotation.sentences:
             for word in sentence.words:
                 lemmas.append(word.lemma.lower())
                 tags.append(word.pos)
-    # method for spaCy models
+    # method for spaCy docs
     else:
         for word in annotation:
             lemmas.append(word.lemma_.lower())
@@ -27,12 +34,50 @@ def process_sentence(model,sentence):
     return lemmas, tags
 
 
-'''Tag all sentences from a specified language in a given dataframe.
-Sentences are lemmatized as well.
-Returns df with two new columns: 'lemmas' and 'POS_tags'
+'''Get lemmas and part-of-speech tags of a sentence using a model,
+spaCy or Stanza (StanfordNLP).
 '''
-def tag_df(df, lang):
-    # load the appropriate model, try spaCy first, Stanza (Stanford NLP) next
+def process_sentence(model,sentence):
+    # generate model annotation of sentence and
+    # retrieve lemma and POS tag for each word
+    return read_annotation(model(sentence))
+
+
+# models loaded in this process, by language, reused across batches and
+# by worker processes (forked workers inherit them, others load them once)
+_MODELS = {}
+
+# Stanza processors needed for lemmas and POS tags, without the parser and NER;
+# mwt (multi-word token expansion) only exists for some languages, e.g., Arabic
+STANZA_PROCESSORS = ["tokenize,mwt,pos,lemma", "tokenize,pos,lemma"]
+
+
+'''Load a CPU-only Stanza (Stanford NLP) pipeline with only the
+tokenize/(mwt)/pos/lemma processors, downloading them first if download
+(worker processes load the files their parent downloaded).
+'''
+def load_stanza(lang, download=True):
+    import stanza
+    for processors in STANZA_PROCESSORS:
+        try:
+            if download:
+                stanza.download(lang, processors=processors)
+            return stanza.Pipeline(lang, processors=processors, use_gpu=False, download_method=None)
+        except Exception as error:
+            # processor (or language) not available, try without mwt
+            last_error = error
+    raise ValueError(f"No Stanza pipeline for {lang}: {last_error}")
+
+
+'''Load the appropriate model for a language,
+try spaCy first, Stanza (Stanford NLP) next.
+A model is loaded only once per process.
+'''
+def load_model(lang):
+    if lang in _MODELS:
+        return _MODELS[lang]
+
+    import spacy
     name = lang + "_core_news_sm"
     try:
         model = spacy.load(name, disable=["parser", "ner"])
@@ -44,29 +89,189 @@ def tag_df(df, lang):
         except OSError:
             print("spaCy model not found, language not likely supported. Check here: spacy.io/models")
             print("Now trying stanza library...")
-            
+
             # attempt tagging with Stanza (Stanford NLP)
             try:
-                stanza.download(lang)
-                model = stanza.Pipeline(lang)
+                model = load_stanza(lang)
             except ValueError:
                 print("Stanza model not found, language not likely supported. Check here: stanfordnlp.github.io/stanza/available_models.html")
                 print("You will need to implement tagging or supply a tagged dataset.")
                 sys.exit()
 
-    # loop over df and generate lemmas and POS tags
-    all_lemmas = []
-    all_tags = []
-    for index, row in df.iterrows():
-        lemmas, tags = process_sentence(model, row["sentence"])
-        all_lemmas.append(lemmas)
-        all_tags.append(tags)
+    _MODELS[lang] = model
+    return model
+
+
+'''Split an iterable of sentences into lists of (at most) size sentences.
+'''
+def batches(sentences, size):
+    batch = []
+    for sentence in sentences:
+        batch.append(sentence)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+'''Annotate a batch of sentences with a Stanza pipeline in one call:
+every sentence is its own document, and the list of documents is processed
+together, so Stanza batches words across sentences.
+Returns a list of (lemmas, tags), one per sentence.
+'''
+def tag_stanza_batch(model, sentences):
+    import stanza
+    docs = model([stanza.Document([], text=sentence) for sentence in sentences])
+    return [read_annotation(doc) for doc in docs]
+
+
+def _stanza_worker_init(lang):
+    # forked workers inherit the parent's pipeline; others load it, without
+    # trying spaCy or downloading again
+    if lang not in _MODELS:
+        _MODELS[lang] = load_stanza(lang, download=False)
+
+
+def _stanza_worker_batch(job):
+    lang, sentences = job
+    return tag_stanza_batch(_MODELS[lang], sentences)
+
+
+'''Start n_process worker processes that each load the Stanza pipeline
+of a language once, for tag_sentences(). The caller closes the pool.
+'''
+def stanza_pool(lang, n_process):
+    from multiprocessing import Pool
+    return Pool(n_process, initializer=_stanza_worker_init, initargs=(lang,))
+
+
+'''Stream sentences through a model and yield (lemmas, tags) per sentence,
+in the same order the sentences were given.
+Sentences are processed in batches of batch_size sentences:
+spaCy models with nlp.pipe over n_process worker processes,
+Stanza pipelines with one call per batch, over the worker processes of pool
+(see stanza_pool(); needs lang), or over n_process worker processes
+started for this call if no pool is given.
+'''
+def tag_sentences(model, sentences, batch_size=1000, n_process=1, lang=None, pool=None):
+    if is_stanza(model):
+        sentence_batches = batches(sentences, batch_size)
+        if pool is not None and lang is not None:
+            jobs = ((lang, batch) for batch in sentence_batches)
+            for annotations in pool.imap(_stanza_worker_batch, jobs):
+                yield from annotations
+        elif n_process > 1 and lang is not None:
+            with stanza_pool(lang, n_process) as pool:
+                jobs = ((lang, batch) for batch in sentence_batches)
+                for annotations in pool.imap(_stanza_worker_batch, jobs):
+                    yield from annotations
+        else:
+            for batch in sentence_batches:
+                yield from tag_stanza_batch(model, batch)
+    else:
+        for doc in model.pipe(sentences, batch_size=batch_size, n_process=n_process):
+            yield read_annotation(doc)
+
+
+'''Identify a loaded model (library, model name and version), so that
+cached annotations are only reused for the same tagger.
+Models other than Stanza pipelines and spaCy Language objects, with the
+same meta (e.g., benchmark.StubTagger), are named by their class instead
+of a library, so spaCy is not imported for them.
+'''
+def tagger_id(model, lang):
+    if is_stanza(model):
+        import stanza
+        return f"stanza-{stanza.__version__}-{lang}"
+    meta = model.meta
+    if type(model).__module__.startswith("spacy"):
+        import spacy
+        library = f"spacy-{spacy.__version__}"
+    else:
+        library = type(model).__name__
+    return f"{library}-{meta['lang']}_{meta['name']}-{meta['version']}"
+
+
+'''Identify the tagger load_model() would use for a language without loading
+it: the installed versions of spaCy, its model for the language and Stanza.
+It does not depend on the models loaded in this process, so every run with
+the same packages gets the same identity. Used in the configuration of the
+tag stage (see main.py), so that a checkpoint or a previous run is only
+reused with the same tagger.
+'''
+def installed_tagger(lang):
+    from importlib import metadata
+    versions = []
+    for package in ["spacy", lang + "_core_news_sm", "stanza"]:
+        try:
+            versions.append(f"{package}-{metadata.version(package)}")
+        except metadata.PackageNotFoundError:
+            pass
+    return " ".join(versions)
+
+
+'''Tag all sentences from a specified language in a given dataframe.
+Sentences are lemmatized as well.
+Each unique (normalized) sentence is tagged once; if an AnnotationCache is
+given, sentences already in the cache are not tagged again.
+Sentences are streamed through the model in batches of batch_size,
+over n_process processes.
+An already loaded model can be passed to avoid loading it again,
+and, for Stanza, a pool of workers that have loaded it (see stanza_pool()).
+Returns df with two new columns: 'lemmas' and 'POS_tags'
+'''
+def tag_df(df, lang, batch_size=1000, n_process=1, cache=None, model=None, pool=None):
+    if model is None:
+        model = load_model(lang)
+    tagger = tagger_id(model, lang)
+
+    # only unique sentences missing from the cache go through the model
+    sentences = df["sentence"].map(normalize_sentence)
+    unique = list(pd.unique(sentences))
+    annotations = cache.get_many(unique, tagger) if cache is not None else {}
+    to_tag = [s for s in unique if s not in annotations]
+    print(f"{len(sentences)} sentences, {len(unique)} unique, {len(to_tag)} to tag")
+
+    # stream sentences through the model and collect lemmas and POS tags
+    tagged = {}
+    start = time.perf_counter()
+    results = tag_sentences(model, to_tag, batch_size=batch_size, n_process=n_process, lang=lang, pool=pool)
+    for count, (sentence, annotation) in enumerate(zip(to_tag, results), start=1):
+        tagged[sentence] = annotation
         # progress check
-        if index%1000 == 0:
-            print('working on row ' + str(index))
+        if count%batch_size == 0:
+            rate = count / (time.perf_counter() - start)
+            print(f'tagged {count} sentences ({rate:.1f} sentences/s)')
+
+    elapsed = time.perf_counter() - start
+    rate = len(tagged) / elapsed if elapsed > 0 else 0.0
+    print(f'Tagged {len(tagged)} sentences in {elapsed:.1f}s ({rate:.1f} sentences/s)')
+
+    if cache is not None:
+        cache.put_many(tagged, tagger)
+        cache.report()
+    annotations.update(tagged)
 
     # add lemmas and tags as new columns to df
-    df["lemmas"] = all_lemmas
-    df["POS_tags"] = all_tags
+    df["lemmas"] = [annotations[s][0] for s in sentences]
+    df["POS_tags"] = [annotations[s][1] for s in sentences]
 
-    return df
\ No newline at end of file
+    return df
+
+
+'''Tag a stream of dataframe chunks (see main.read_corpus), loading the
+model only once. Stanza worker processes (n_process > 1) are also started
+once, and reused for every chunk until the last one.
+Yields every chunk with 'lemmas' and 'POS_tags' columns.
+'''
+def tag_chunks(chunks, lang, batch_size=1000, n_process=1, cache=None):
+    model = load_model(lang)
+    pool = stanza_pool(lang, n_process) if is_stanza(model) and n_process > 1 else None
+    try:
+        for chunk in chunks:
+            yield tag_df(chunk, lang, batch_size=batch_size, n_process=n_process, cache=cache, model=model, pool=pool)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
@@ -1,15 +1,10 @@
-from ast import literal_eval
+import numpy as np
 import pandas as pd
 import re
 import sys
 
-
-def evaluate(c, s):
-    '''
-    Returns regex evaluation of a pair.
-    1 if the pair violates the constraint, 0 if no violation.
-    '''
-    return int(len(re.findall(c,s)) > 0)
+from data_io import parse_list
+from features import FeatureStore
 
 
 def read_constraint_file(path):
@@ -27,70 +22,215 @@ def read_constraint_file(path):
     return constraints
 
 
-def syl_count(word):
+class ConstraintSet:
+    '''
+    All constraints of a constraint dictionary (see read_constraint_file())
+    compiled together into one regular expression: one optional lookahead
+    per constraint, each capturing into its own named group. One match of the
+    combined expression at the start of a string finds every constraint the
+    string violates, i.e. every constraint that re.search would find.
+
+    Constraints that cannot be combined (backreferences, inline flags) are
+    checked on their own with re.search.
+    '''
+
+    def __init__(self, cons):
+        self.names = list(cons.keys())
+        self.patterns = [re.compile(cons[name]) for name in self.names]
+        self.combined = None
+        self.group_ix = []
+        self.separate = list(range(len(self.names)))
+
+        combinable = [i for i, p in enumerate(self.patterns)
+                      if not re.search(r'\\[1-9]|\(\?P=|\(\?[aiLmsux]+\)', p.pattern)
+                      and (p.flags & ~re.UNICODE) == 0]
+        if combinable:
+            # [\s\S]*? reaches every position, newlines included; without
+            # re.DOTALL, '.' in a constraint keeps its meaning
+            parts = [f"(?:(?=[\\s\\S]*?(?P<_con{i}>{self.patterns[i].pattern}))|)" for i in combinable]
+            try:
+                self.combined = re.compile("".join(parts))
+            except re.error:
+                combinable = []
+        if self.combined is not None:
+            self.group_ix = [(i, self.combined.groupindex[f"_con{i}"] - 1) for i in combinable]
+            self.separate = [i for i in range(len(self.names)) if i not in combinable]
+
+    def __len__(self):
+        return len(self.names)
+
+    def scan(self, s):
+        '''
+        Violations of every constraint by string s, as a list of booleans.
+        '''
+        violations = [False] * len(self.names)
+        if self.combined is not None:
+            groups = self.combined.match(s).groups()
+            for i, g in self.group_ix:
+                violations[i] = groups[g] is not None
+        for i in self.separate:
+            violations[i] = self.patterns[i].search(s) is not None
+        return violations
+
+    def violations(self, strings):
+        '''
+        Violation matrix of a list of strings:
+        boolean array of shape (#strings, #constraints).
+        '''
+        matrix = np.zeros((len(strings), len(self.names)), dtype=bool)
+        for row, s in enumerate(strings):
+            matrix[row] = self.scan(s)
+        return matrix
+
+
+# columns of add_pair_columns()
+PAIR_COLUMNS = ["prenominal","adj_lemma","noun_lemma"]
+
+
+def add_pair_columns(df):
     '''
-    Return number of syllables in a word.
-    '.' assumed as syllable boundary marker.
-    Example: CV.CV = 2 syllables
+    Compute the order and the pair of every row once, as reusable columns
+    (only if df does not have them yet):
+    "prenominal" = 1 if target tags are ["ADJ","NOUN"], 0 otherwise;
+    "adj_lemma" and "noun_lemma" = the pair in prenominal order,
+    which identifies the pair regardless of its order.
+    These columns are internal: drop_pair_columns() removes them before
+    a dataframe is written.
+
+    Returns df with the new columns.
     '''
-    boundaries = word.count('.')
+    if set(PAIR_COLUMNS).issubset(df.columns):
+        return df
 
-    return boundaries + 1
+    tags = df["target_tags"].map(parse_list)
+    pairs = df["target_lemmas"].map(parse_list)
+    prenominal = tags.map(lambda order: order == ['ADJ','NOUN']).astype(bool)
+    first = pairs.str[0]
+    second = pairs.str[1]
 
+    df["prenominal"] = prenominal.astype(int)
+    df["adj_lemma"] = first.where(prenominal, second)
+    df["noun_lemma"] = second.where(prenominal, first)
+
+    return df
 
-def length_con(df,lang):
+
+def pair_columns(df):
+    '''
+    The prenominal, adj_lemma and noun_lemma columns of df (see
+    add_pair_columns()), computed if df does not have them,
+    without changing df.
+    '''
+    if set(PAIR_COLUMNS).issubset(df.columns):
+        return df[PAIR_COLUMNS]
+    return add_pair_columns(df[["target_tags","target_lemmas"]].copy())[PAIR_COLUMNS]
+
+
+def drop_pair_columns(df):
+    '''
+    Removes the columns of add_pair_columns() from df, if it has them:
+    they are internal, and not part of the output.
+    '''
+    return df.drop(columns=[col for col in PAIR_COLUMNS if col in df.columns])
+
+
+def prenominal_order(df):
+    '''
+    Order of the target pair in every row of df:
+    1 if target tags are ["ADJ","NOUN"] (prenominal), -1 otherwise.
+    '''
+    return np.where(pair_columns(df)["prenominal"].values == 1, 1, -1)
+
+
+def length_con(df,lang,store=None):
     '''
     Calculate length constraint values for every row in df.
     con = 1 if postnominal order is longer-word last
     con = -1 if prenominal order is longer-word last
     con = 0 if neither order preferred (same length)
 
-    Calls syl_count() helper function. 
-    Word length measured by number of syllables, marked by '.'.
+    Word length measured by number of syllables, marked by '.',
+    looked up in a FeatureStore (a new one if none is given),
+    so it is counted once per word.
 
     Returns df with new column "length" with constraint values.
     '''
-    length_col = []
-    for index,row in df.iterrows():
-        order = row["target_tags"]
-        pform1 = row["pform1"].strip('.').strip(' ')
-        pform2 = row["pform2"].strip('.').strip(' ')
-        if lang == 'ar':
-            pform1 = row["CV_form1"]
-            pform2 = row["CV_form2"]
-        if type(order) != list:
-            order = literal_eval(order)
-        
-        if order == ['ADJ','NOUN']:
-            prenominal = 1
-        else:
-            prenominal = -1
-    
-        # shorter word comes first
-        if syl_count(pform1) < syl_count(pform2):
-            prefer_curr_order = 1
-        # shorter word comes last
-        elif syl_count(pform2) < syl_count(pform1):
-            prefer_curr_order = -1
-        # equal length
-        else:
-            prefer_curr_order = 0
-
-        # -1 if postnominal is short-long, 1 if prenominal is short-long, else 0
-        constraint_outcome = prefer_curr_order * prenominal
-
-        length_col.append(constraint_outcome)
-    
-    df["length"] = length_col
-    
+    if store is None:
+        store = FeatureStore()
+    prenominal = prenominal_order(df)
+    if lang == 'ar':
+        codes1 = store.encode(df["CV_form1"], strip=False)
+        codes2 = store.encode(df["CV_form2"], strip=False)
+    else:
+        codes1 = store.encode(df["pform1"])
+        codes2 = store.encode(df["pform2"])
+
+    # syllable counts, '.' assumed as syllable boundary marker
+    syls1 = store.syllables[codes1]
+    syls2 = store.syllables[codes2]
+
+    # 1 if shorter word comes first, -1 if shorter word comes last, 0 if equal length
+    prefer_curr_order = np.sign(syls2 - syls1)
+
+    # -1 if postnominal is short-long, 1 if prenominal is short-long, else 0
+    df["length"] = (prefer_curr_order * prenominal).astype(int)
+
+    return df
+
+
+def pair_counts(df):
+    '''
+    Token frequency of all target lemma pairs in df,
+    in prenominal and in postnominal order.
+
+    Returns a dataframe with columns adj_lemma, noun_lemma,
+    prenominal (#tokens in ["ADJ","NOUN"] order) and postnominal (#tokens in
+    ["NOUN","ADJ"] order). Counts of several dataframes can be added up
+    (see combine_pair_counts()).
+    '''
+    pairs = pair_columns(df).groupby(["adj_lemma","noun_lemma"], sort=False, dropna=False)["prenominal"]
+    counts = pairs.agg(["sum","size"]).reset_index()
+    counts["postnominal"] = counts["size"] - counts["sum"]
+
+    return counts.rename(columns={"sum": "prenominal"}).drop(columns=["size"])
+
+
+def combine_pair_counts(*counts, subtract=None):
+    '''
+    Add up pair counts (see pair_counts()), minus the pair counts in subtract.
+    Pairs left without tokens are removed.
+    '''
+    tables = list(counts)
+    if subtract is not None:
+        negative = subtract.copy()
+        negative[["prenominal","postnominal"]] = -negative[["prenominal","postnominal"]]
+        tables.append(negative)
+    combined = pd.concat(tables, ignore_index=True)
+    combined = combined.groupby(["adj_lemma","noun_lemma"], sort=False, dropna=False)[["prenominal","postnominal"]].sum().reset_index()
+
+    return combined[(combined["prenominal"] + combined["postnominal"]) > 0].reset_index(drop=True)
+
+
+def apply_pair_counts(df, counts):
+    '''
+    Set the relative frequency of every row in df from pair counts
+    (see pair_counts()), which may have been counted over more data than df.
+
+    Returns df with new column "relative_frequency" with proportion.
+    '''
+    pairs = pair_columns(df)
+    counts = counts.set_index(["adj_lemma","noun_lemma"])
+    proportion = counts["prenominal"] / (counts["prenominal"] + counts["postnominal"])
+    keys = pd.MultiIndex.from_arrays([pairs["adj_lemma"], pairs["noun_lemma"]])
+    df["relative_frequency"] = proportion.reindex(keys).values
+
     return df
 
 
 def rel_freq(df):
     '''
-    Create a token frequency dictionary of all target lemma pairs in df.
-    Keys are pairs in prenominal order, values are token frequency counts,
-    [#prenominal_tokens, #postnominal_tokens].
+    Count the token frequency of all target lemma pairs in df,
+    in prenominal and in postnominal order (see pair_counts()).
 
     Then, calculate the proportion each pair occurs in ["ADJ","NOUN"] order.
     
@@ -100,66 +240,7 @@ def rel_freq(df):
 
     Returns df with new column "relative_frequency" with proportion.
     '''
-    # build up order token frequency dictionary of all pair types
-    frequency_dict = {}
-    for index,row in df.iterrows():
-        # get tags
-        tags = row["target_tags"]  
-        if type(tags) != list:
-            tags = literal_eval(tags)
-        # get pair (lemmas)
-        pair = row["target_lemmas"]
-        if type(pair) != list:
-            pair = literal_eval(pair)  
-
-        # get order and make pair into key
-        if tags == ['ADJ','NOUN']:
-            order = 1
-            pair = tuple(pair)
-        else:
-            order = 0
-            pair = (pair[1],pair[0])
-
-        # add to dict, [#prenominal_tokens,#postnominal_tokens]
-        if pair not in frequency_dict.keys():
-            if order == 1:
-                frequency_dict[pair] = [1,0]
-            else:
-                frequency_dict[pair] = [0,1]
-        else:
-            if order == 1:
-                frequency_dict[pair][0] += 1
-            else:
-                frequency_dict[pair][1] += 1
-   
-    # add relative frequency column
-    freq_col = []
-    for index,row in df.iterrows():
-        # get tags
-        tags = row["target_tags"]  
-        if type(tags) != list:
-            tags = literal_eval(tags)
-        # get pair (lemmas)
-        pair = row["target_lemmas"]
-        if type(pair) != list:
-            pair = literal_eval(pair)        
-        # get order and format pair as dict key
-        if tags == ['ADJ','NOUN']:
-            order = 1
-            pair = tuple(pair)
-        else:
-            order = 0
-            pair = (pair[1],pair[0])
-
-        # calculate relative frequency: token frequency of pair in prenominal order / all appearances
-        relative_frequency = frequency_dict[pair][0] / (frequency_dict[pair][0] + frequency_dict[pair][1])
-
-        # add to relative frequency column
-        freq_col.append(relative_frequency)
-
-    df["relative_frequency"] = freq_col
-    
-    return df
+    return apply_pair_counts(df, pair_counts(df))
 
 
 def outcome(df):
@@ -171,91 +252,104 @@ def outcome(df):
 
     Returns df with new column "outcome" with outcome values.
     '''
-    outcome_col = []
-    for index,row in df.iterrows():
-        order = row["target_tags"]  
-        if type(order) != list:
-            order = literal_eval(order)
-        if order == ['ADJ','NOUN']:
-            outcome = 1
-        else:
-            outcome = 0
-        outcome_col.append(outcome)
-
-    # add outcome column to dataframe
-    df["outcome"] = outcome_col
+    df["outcome"] = pair_columns(df)["prenominal"].values
 
     return df
 
 
-def add_constraints_to_df(df, cons, lang):
+def pair_preferences(pairs, constraint_set):
+    '''
+    Takes a dataframe of unique (form1, form2) pairs and a ConstraintSet.
+    Returns an array of shape (#pairs, #constraints) with, for every pair
+    and constraint:
+    1 if the current order is preferred (only the reverse order violates),
+    -1 if the reverse order is preferred (only the current order violates),
+    0 if both or neither order has a violation.
+    '''
+    pair_violates = constraint_set.violations([f1 + "#" + f2 for f1, f2 in zip(pairs["form1"], pairs["form2"])])
+    reverse_violates = constraint_set.violations([f2 + "#" + f1 for f1, f2 in zip(pairs["form1"], pairs["form2"])])
+
+    return reverse_violates.astype(int) - pair_violates.astype(int)
+
+
+def encode_pairs(codes1, codes2, store):
+    '''
+    Takes the word codes (see FeatureStore) of the first and second
+    word of every row.
+    Returns an array of pair codes (one per row) and
+    a dataframe of the unique pairs of forms (form1, form2), indexed by code.
+    '''
+    n = max(len(store), 1)
+    pair_codes, unique_keys = pd.factorize(codes1.astype(np.int64) * n + codes2)
+    unique_pairs = pd.DataFrame({
+        "form1": store.forms[unique_keys // n],
+        "form2": store.forms[unique_keys % n],
+    })
+
+    return pair_codes, unique_pairs
+
+
+def add_constraints_to_df(df, cons, lang, frequencies=True, store=None):
     '''
     Takes in df and constraint dictionary, returns df which has an added
     column for each key in cons showing the violation values.
     Also adds column for length constraint (shorter-first),
     relative frequency (#pair tokens in prenominal order/#total pair tokens),
     and outcome (1 prenominal; -1 postnominal).
+
+    If frequencies is False, relative frequency is left empty, to be set
+    later from the pair counts of all the data (see apply_pair_counts()),
+    e.g., when df is one chunk of the data.
+
+    All constraints are evaluated together (see ConstraintSet) once per
+    unique pair of forms, and the results are broadcast back to the rows
+    with that pair. Words are coded in a FeatureStore (a new one if none is
+    given; pass the same store for every chunk of a dataset).
     '''
-    # evaluate all data for one phonological constraint at a time
-    for constraint in cons:
-        con_column = []
-
-        con_name = constraint
-        con_regex = cons[con_name]
-        for index, row in df.iterrows():
-            order = row["target_tags"]
-            pform1 = row["pform1"].strip('.').strip(' ')
-            pform2 = row["pform2"].strip('.').strip(' ')
-
-            if lang == 'ar':
-                if con_name == 'clash' or con_name == 'lapse':
-                    pform1 = row["CV_form1"]
-                    pform2 = row["CV_form2"]
-
-            pair = pform1 + "#" + pform2
-            reverse_pair = pform2 + "#" + pform1
-
-            pair_violates = evaluate(con_regex,pair)
-            reverse_violates = evaluate(con_regex,reverse_pair)
-
-            if type(order) != list:
-                order = literal_eval(order)
-            if order == ['ADJ','NOUN']:
-                prenominal = 1
-            else:
-                prenominal = -1
-            
-            # reverse order violates the constraint, current order is preferred
-            if reverse_violates and (not pair_violates):
-                prefer_curr_order = 1
-            # current order violates the constraint, reverse order is preferred
-            elif pair_violates and (not reverse_violates):
-                prefer_curr_order = -1
-            # no preference, both or neither order has a violation
-            else:
-                prefer_curr_order = 0
-
-            # -1 if postnominal is better, 1 if prenominal is better, 0 otherwise
-            constraint_outcome = prefer_curr_order * prenominal
-
-            # if (con_name == 'lapse') and (prefer_curr_order == 1):
-            #     print(pair + '\t good job, no lapse')
-            #     print(reverse_pair + '\t bad job, lapse')
-            #     print(order, constraint_outcome)
-            #     print('$$$$$$$$$$$$$$$$$$')
-
-            # append to new column for that constraint
-            con_column.append(constraint_outcome)
-
-        # add constraint column to dataframe
-        df[con_name] = con_column
+    if store is None:
+        store = FeatureStore()
+    # order and pair of every row, computed once (dropped before returning)
+    df = add_pair_columns(df)
+    prenominal = prenominal_order(df)
+
+    # row -> word codes -> unique pair codes
+    codes1 = store.encode(df["pform1"])
+    codes2 = store.encode(df["pform2"])
+    pair_codes, unique_pairs = encode_pairs(codes1, codes2, store)
+    if lang == 'ar':
+        cv_codes1 = store.encode(df["CV_form1"], strip=False)
+        cv_codes2 = store.encode(df["CV_form2"], strip=False)
+        store.set_cv_forms(codes1, cv_codes1)
+        store.set_cv_forms(codes2, cv_codes2)
+        cv_codes, unique_cv_pairs = encode_pairs(cv_codes1, cv_codes2, store)
+
+    # evaluate all constraints on all unique pairs in one scan per pair
+    # (in Arabic, clash and lapse are evaluated on CV forms)
+    cv_names = [name for name in cons if lang == 'ar' and (name == 'clash' or name == 'lapse')]
+    pform_names = [name for name in cons if name not in cv_names]
+    preferences = {}
+    if pform_names:
+        constraint_set = ConstraintSet({name: cons[name] for name in pform_names})
+        pair_prefs = pair_preferences(unique_pairs, constraint_set)[pair_codes]
+        preferences.update({name: pair_prefs[:, i] for i, name in enumerate(pform_names)})
+    if cv_names:
+        cv_set = ConstraintSet({name: cons[name] for name in cv_names})
+        cv_prefs = pair_preferences(unique_cv_pairs, cv_set)[cv_codes]
+        preferences.update({name: cv_prefs[:, i] for i, name in enumerate(cv_names)})
+
+    for con_name in cons:
+        # -1 if postnominal is better, 1 if prenominal is better, 0 otherwise
+        df[con_name] = preferences[con_name] * prenominal
 
     ### Constraints not loaded from regex file ###
     # length constraint
-    df = length_con(df,lang)
+    df = length_con(df,lang,store)
     # relative frequency constraint
-    df = rel_freq(df)
+    if frequencies:
+        df = rel_freq(df)
+    else:
+        df["relative_frequency"] = np.nan
     # outcome (dependent variable)
     df = outcome(df)
     
-    return df
\ No newline at end of file
+    return drop_pair_columns(df)
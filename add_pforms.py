@@ -1,24 +1,30 @@
-from ast import literal_eval
 import pandas as pd
 import string
 import sys
 import re
 
+from data_io import parse_list
 
-def lookup(word, lexicon, lang):
+
+def build_index(lexicon):
+    '''
+    Builds a hash index of a phonological lexicon:
+    a pandas Series of phonological forms indexed by orthographic word.
+    Only the first pronunciation entry of every word is kept.
+    '''
+    first_entries = lexicon.drop_duplicates(subset="word", keep="first")
+    return pd.Series(first_entries["phonological_form"].values, index=first_entries["word"].values)
+
+
+def lookup(word, index, lang):
     '''
     Retrieves information about an orthographic word from a phonological lexicon
+    index, see build_index()
     (min: phonological form, but you may want to add additional information, 
     depending on the constraints you will code downstream).
-    Returns the information as a list.
+    Returns None if the word is not in the lexicon.
     '''
-    df = lexicon.loc[lexicon["word"] == word].head(1) # first pronunciation entry
-    try:
-        pform = df["phonological_form"].values[0]
-    except IndexError:
-        pform = None
-    
-    return pform
+    return index.get(word) # first pronunciation entry
 
 
 def get_pforms(df,lexicon,lang):
@@ -26,52 +32,40 @@ def get_pforms(df,lexicon,lang):
     Takes a dataset of tagged target sequences and a lexicon that has
     (at least) orthography-phonological form pairs and returns the original dataset
     with the phonological forms of the target sequences.
+    The lexicon can be given as a dataframe or as an index from build_index().
     '''
     # remove rows with target sequences that aren't pairs
     try:
         df = df[df["target_tokens"].apply(lambda x: len(x.split(',')) > 1)]
     except AttributeError:
         df = df[df["target_tokens"].apply(lambda x: len(x) > 1)]
+    df = df.copy()
 
-    # initialize new columns
-    pinfo1_column = [] #phonological form of the first target
-    pinfo2_column = [] #pform of the second target
-    to_drop = [] #if no pform, remove row
-    
-    # get phonological forms of each target
-    for index, row in df.iterrows():
-        if index%1000 == 0:
-            print('working on row ' + str(index))
+    if isinstance(lexicon, pd.DataFrame):
+        index = build_index(lexicon)
+    else:
+        index = lexicon
 
-        targets = row["target_tokens"]
-        if type(targets) != list:
-            targets = literal_eval(targets)
-        targets_pinfo = []
-        for i, word in enumerate(targets):
-            pinfo = lookup(word.lower(), lexicon, lang)
-            targets_pinfo.append(pinfo)
-        
-        if targets_pinfo[0] == None or targets_pinfo[1] == None:
-            to_drop.append(True)
-        else:
-            to_drop.append(False)
-        pinfo1_column.append(targets_pinfo[0])
-        pinfo2_column.append(targets_pinfo[1])
+    # get phonological forms of each target, one hash lookup per token
+    targets = df["target_tokens"].map(parse_list)
+    words1 = targets.str[0].str.lower()
+    words2 = targets.str[1].str.lower()
+    df["pform1"] = words1.map(index)
+    df["pform2"] = words2.map(index)
 
-    df["pform1"] = pinfo1_column
-    df["pform2"] = pinfo2_column
-    df["DROP"] = to_drop
+    # if no pform, remove row
+    to_drop = ~(words1.isin(index.index) & words2.isin(index.index))
 
     all_forms = df.shape[0]
-    # df_missing = df[df["DROP"] == True]
+    # df_missing = df[to_drop]
     # df_missing.to_csv(path_or_buf = "sanity_check.csv", index=False)
-    df = df[df["DROP"] == False].drop(columns=["DROP"])
+    df = df[~to_drop]
     cleaned_df = df.shape[0]
 
     missing = all_forms - cleaned_df
-    missing_percentage = missing/all_forms * 100
+    missing_percentage = missing/all_forms * 100 if all_forms else 0.0
 
     print(f"Missing pronunciations for one or more member of {missing} target sequences.") 
     print(f"Dropped {missing_percentage}% of dataset.")
 
-    return df
\ No newline at end of file
+    return df
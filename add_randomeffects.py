@@ -5,64 +5,97 @@ NOUN: containing the noun lemma in the pair
 FIXED: if relative frequency is equivalent to 1.0 or 0.0,
 meaning pair is 100% prenominal or postnominal
 
+With --codes, integer codes for R are added too:
+ADJECTIVE_ID, NOUN_ID: lemma IDs (1, 2, ..., in order of first occurrence)
+FREQ_BAND: frequency band of the pair, floor(log2(#pair tokens))
+
+All columns are derived in one pass from the pair columns of the output
+(see add_constraints.add_pair_columns()). The same table is written by
+main.py --effects, as an optional stage after the constraints.
+
 Usage:
 python add_randomeffects.py dataset.csv
+python add_randomeffects.py output_it.parquet --codes
 '''
 
 
 import argparse
+import numpy as np
+import os
 import pandas as pd
-from ast import literal_eval
+from add_constraints import pair_columns, pair_counts
+from data_io import read_data, write_data
 
 
-def add_wordeffects(df):
+def add_wordeffects(df, pairs=None):
     '''
     Add columns for ADJ lemma and N lemma.
+    pairs are the pair columns of df, if already known (see pair_columns()).
     '''
-    noun_col = []
-    adj_col = []
-
-    for index,row in df.iterrows():
-        order = row["target_tags"]
-        if type(order) != list:
-            order = literal_eval(order)
-        pair = row["target_lemmas"]
-        if type(pair) != list:
-            pair = literal_eval(pair)
-
-        if order == ['ADJ','NOUN']:
-            adj = pair[0]
-            noun = pair[1]
-        else:
-            noun = pair[0]
-            adj = pair[1]
-
-        noun_col.append(noun)
-        adj_col.append(adj)
-
+    if pairs is None:
+        pairs = pair_columns(df)
 
     ix = df.columns.get_loc("target_tags")
-    df.insert(ix+1, "NOUN", noun_col)
-    ix = df.columns.get_loc("NOUN")
-    df.insert(ix+1, "ADJECTIVE", adj_col)
+    df.insert(ix+1, "NOUN", pairs["noun_lemma"].values)
+    df.insert(ix+2, "ADJECTIVE", pairs["adj_lemma"].values)
 
     return df
 
+
 def add_stricteffect(df):
     '''
     Add column for strict ordering.
     '''
-    strict_col = []
-    for index,row in df.iterrows():
-        relative_frequency = row["relative_frequency"]
-        if (relative_frequency != 1.0) and (relative_frequency != 0.0):
-            strict = 0
-        else:
-            strict = 1
+    df["FIXED"] = df["relative_frequency"].isin([0.0, 1.0]).astype(int)
+
+    return df
 
-        strict_col.append(strict)
 
-    df["FIXED"] = strict_col
+def effect_codes(counts):
+    '''
+    Takes pair counts (see add_constraints.pair_counts()).
+    Returns the integer ID of every adjective and noun lemma (Series indexed
+    by lemma; 1, 2, ..., in order of first occurrence) and the frequency band
+    of every pair (Series indexed by adj_lemma, noun_lemma).
+    '''
+    adj_ids = pd.Series(np.arange(1, counts["adj_lemma"].nunique(dropna=False) + 1),
+                        index=pd.unique(counts["adj_lemma"]))
+    noun_ids = pd.Series(np.arange(1, counts["noun_lemma"].nunique(dropna=False) + 1),
+                         index=pd.unique(counts["noun_lemma"]))
+    totals = (counts["prenominal"] + counts["postnominal"]).values
+    bands = pd.Series(np.floor(np.log2(np.maximum(totals, 1))).astype(int),
+                      index=pd.MultiIndex.from_arrays([counts["adj_lemma"], counts["noun_lemma"]]))
+
+    return adj_ids, noun_ids, bands
+
+
+def add_codes(df, codes, pairs=None):
+    '''
+    Add columns ADJECTIVE_ID, NOUN_ID and FREQ_BAND from the codes of effect_codes().
+    '''
+    if pairs is None:
+        pairs = pair_columns(df)
+    adj_ids, noun_ids, bands = codes
+
+    df["ADJECTIVE_ID"] = pairs["adj_lemma"].map(adj_ids).values
+    df["NOUN_ID"] = pairs["noun_lemma"].map(noun_ids).values
+    keys = pd.MultiIndex.from_arrays([pairs["adj_lemma"], pairs["noun_lemma"]])
+    df["FREQ_BAND"] = bands.reindex(keys).values
+
+    return df
+
+
+def add_randomeffects(df, codes=None):
+    '''
+    Add the NOUN, ADJECTIVE and FIXED columns in one pass over the pair
+    columns of df, and the integer codes if codes are given (see effect_codes();
+    codes of the pair counts of all the data, when df is one chunk of it).
+    '''
+    pairs = pair_columns(df)
+    df = add_wordeffects(df, pairs)
+    df = add_stricteffect(df)
+    if codes is not None:
+        df = add_codes(df, codes, pairs)
 
     return df
 
@@ -70,14 +103,18 @@ def add_stricteffect(df):
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
-    parser.add_argument("input_file",  
-    help="Give path of the directory with data. Must be .csv.")
+    parser.add_argument("input_file",
+    help="Give path of the directory with data. Must be .parquet or .csv.")
+    parser.add_argument("--codes", action="store_true",
+    help="Also add integer codes for R: lemma IDs and pair frequency bands.")
     args = parser.parse_args()
 
     # read in data from file as pandas df
-    df = pd.read_csv(args.input_file)
-    updated_df = add_wordeffects(df)
-    updated_df = add_stricteffect(updated_df)
+    df = read_data(args.input_file)
+    codes = effect_codes(pair_counts(pair_columns(df))) if args.codes else None
+    updated_df = add_randomeffects(df, codes)
 
     # write to output file
-    updated_df.to_csv(path_or_buf=f"updated_{args.input_file}", index=False)
\ No newline at end of file
+    # next to the input file, with a .csv copy for R
+    out_path = os.path.join(os.path.dirname(args.input_file), f"updated_{os.path.basename(args.input_file)}")
+    write_data(updated_df, out_path, csv_copy=True)
@@ -0,0 +1,95 @@
+'''
+Persistent on-disk cache of lemma/POS annotations for tagged sentences.
+
+Common Voice has many duplicate sentences (several speakers record the same
+prompt), and consecutive corpus releases repeat most of the previous one.
+Annotations are stored in a SQLite file, keyed by the hash of the normalized
+sentence together with the tagger identity (model name and version), so a
+cache is never reused across models.
+
+Usage (see POS_tag.tag_df):
+cache = AnnotationCache("annotations.sqlite")
+'''
+
+import hashlib
+import json
+import sqlite3
+import unicodedata
+
+
+def normalize_sentence(sentence):
+    '''
+    Normalize a sentence before it is hashed (and tagged):
+    Unicode NFC composition, leading/trailing whitespace removed.
+    '''
+    return unicodedata.normalize("NFC", sentence).strip()
+
+
+def sentence_key(sentence, tagger):
+    '''
+    Content address of a (normalized) sentence annotated by a tagger.
+    '''
+    content = tagger + "\x00" + sentence
+    return hashlib.sha256(content.encode("utf8")).hexdigest()
+
+
+class AnnotationCache:
+    '''
+    SQLite-backed store of (lemmas, tags) annotations.
+    Keeps count of cache hits and misses for reporting.
+    '''
+
+    # SQLite limits the number of parameters in one statement
+    batch_size = 500
+
+    def __init__(self, path):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS annotations "
+            "(key TEXT PRIMARY KEY, lemmas TEXT NOT NULL, tags TEXT NOT NULL)")
+        self.connection.commit()
+
+    def get_many(self, sentences, tagger):
+        '''
+        Look up normalized sentences annotated by tagger.
+        Returns a dictionary sentence: (lemmas, tags) of the cached sentences;
+        sentences not in the dictionary are misses.
+        '''
+        keys = {sentence_key(s, tagger): s for s in sentences}
+        key_list = list(keys)
+        found = {}
+        for i in range(0, len(key_list), self.batch_size):
+            batch = key_list[i:i+self.batch_size]
+            placeholders = ",".join("?" * len(batch))
+            query = f"SELECT key, lemmas, tags FROM annotations WHERE key IN ({placeholders})"
+            for key, lemmas, tags in self.connection.execute(query, batch):
+                found[keys[key]] = (json.loads(lemmas), json.loads(tags))
+
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+
+        return found
+
+    def put_many(self, annotations, tagger):
+        '''
+        Store a dictionary sentence: (lemmas, tags) of normalized sentences
+        annotated by tagger.
+        '''
+        rows = ((sentence_key(s, tagger), json.dumps(lemmas, ensure_ascii=False), json.dumps(tags))
+                for s, (lemmas, tags) in annotations.items())
+        self.connection.executemany("INSERT OR REPLACE INTO annotations VALUES (?, ?, ?)", rows)
+        self.connection.commit()
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def report(self):
+        print(f"Annotation cache: {self.hits} hits, {self.misses} misses "
+              f"({self.hit_rate()*100:.1f}% hit rate)")
+
+    def close(self):
+        self.connection.close()
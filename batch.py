@@ -0,0 +1,127 @@
+'''
+This script runs the main.py pipeline over several Common Voice corpora
+(languages) at once, one main.py process per language.
+
+The manifest is a .tsv file with a header and one row per language:
+corpus      lang    lexicon         constraints     args
+cv-...-it/  it      phonitalia.csv  cons_it.tsv
+cv-...-fr/  fr      lexique.tsv     cons_fr.tsv     --n_process 2
+The args column is optional and holds extra main.py arguments.
+
+Every language writes to its own directory, {outdir}/{lang}, with its
+checkpoints and a log of its run (log.txt). At most --workers languages run
+at the same time, each in a main.py process of its own, so its memory is
+released when the language is done.
+A summary of timings and row counts is written to {outdir}/summary.csv.
+
+Usage:
+python batch.py manifest.tsv --outdir runs --workers 3
+'''
+
+import argparse
+import os
+import shlex
+import subprocess
+import sys
+import time
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+
+
+def read_manifest(path):
+    '''
+    Reads the manifest of languages to run.
+    Returns a list of dictionaries, one per language.
+    '''
+    import pandas as pd
+    manifest = pd.read_csv(path, sep='\t', dtype=str).fillna('')
+    for col in ["corpus", "lang", "lexicon", "constraints"]:
+        if col not in manifest.columns:
+            raise ValueError(f"Manifest {path} has no '{col}' column.")
+    return manifest.to_dict('records')
+
+
+def job_argv(job, outdir):
+    '''
+    Command line arguments of main.py for one manifest row.
+    '''
+    argv = [job["corpus"], "--lang", job["lang"], "--outdir", outdir]
+    if job["lexicon"]:
+        argv += ["--lexicon", job["lexicon"]]
+    if job["constraints"]:
+        argv += ["--constraints", job["constraints"]]
+    argv += shlex.split(job.get("args", ""))
+    return argv
+
+
+def run_language(job, outdir):
+    '''
+    Runs the pipeline of one language, as a main.py process, in its own
+    output directory, logging its messages to log.txt there.
+    Returns a dictionary of the language's timing and row counts.
+    '''
+    from data_io import count_rows
+
+    lang_dir = os.path.join(outdir, job["lang"])
+    os.makedirs(lang_dir, exist_ok=True)
+    summary = {"lang": job["lang"], "corpus": job["corpus"], "status": "ok"}
+
+    start = time.perf_counter()
+    with open(os.path.join(lang_dir, "log.txt"), 'w', encoding='utf8') as log:
+        result = subprocess.run([sys.executable, MAIN] + job_argv(job, lang_dir), stdout=log, stderr=subprocess.STDOUT)
+    summary["seconds"] = round(time.perf_counter() - start, 2)
+    if result.returncode != 0:
+        summary["status"] = f"failed: exit status {result.returncode}, see log.txt"
+        return summary
+
+    # row counts of every stage output
+    for name in ["tagged", "targets", "dataset", "output"]:
+        for ext in ["parquet", "csv"]:
+            path = os.path.join(lang_dir, f"{name}_{job['lang']}.{ext}")
+            if os.path.exists(path):
+                summary[f"{name}_rows"] = count_rows(path)
+                break
+
+    return summary
+
+
+def run_batch(jobs, outdir, workers):
+    '''
+    Runs every language, (at most) workers at the same time.
+    Returns a dataframe summary with one row per language.
+    '''
+    import pandas as pd
+    os.makedirs(outdir, exist_ok=True)
+    summaries = []
+    start = time.perf_counter()
+    # one main.py process per language: memory is returned when a language
+    # is done, and the language may start processes of its own (--n_process)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_language, job, outdir) for job in jobs]
+        for future in as_completed(futures):
+            summary = future.result()
+            print(f"{summary['lang']}: {summary['status']} ({summary['seconds']}s)")
+            summaries.append(summary)
+    print(f"All languages done in {time.perf_counter() - start:.1f}s")
+
+    return pd.DataFrame(summaries).sort_values("lang")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("manifest",
+    help="Give path of the manifest of languages to run. Must be .tsv.")
+    parser.add_argument("--outdir", default="runs",
+    help="Directory of the per-language output directories and summary. (Default: runs)")
+    parser.add_argument("--workers", type=int, default=None,
+    help="Number of languages run at the same time. (Default: number of languages, at most the number of CPUs)")
+    args = parser.parse_args()
+
+    jobs = read_manifest(args.manifest)
+    workers = args.workers or min(len(jobs), os.cpu_count() or 1)
+
+    summary = run_batch(jobs, args.outdir, workers)
+    summary.to_csv(os.path.join(args.outdir, "summary.csv"), index=False)
+    print(summary.to_string(index=False))
@@ -0,0 +1,440 @@
+'''
+Performance benchmarks of the pipeline scripts.
+
+startup: wall-clock time from launching a script to its exit, for the
+command line entry points (--help), measured in fresh interpreters.
+
+stages: wall-clock time and peak memory of every pipeline stage on synthetic
+data, in isolation (tag, select, pforms, constraints, bow: in memory, without
+file I/O) and end to end (main.py's stage graph from validated.tsv to output,
+with its files). Tagging uses a stub tagger (StubTagger) instead of a spaCy
+model, so the benchmark runs offline: it measures the pipeline around the
+tagger, not the tagger itself.
+
+generate: only writes the synthetic data of every scale to --workdir:
+a Common Voice validated.tsv, tagged data, a lexicon and a constraint file.
+
+The synthetic data is deterministic: the same --rows, --vocab and --seed give
+the same files, which are reused by later runs. Peak memory is the peak of the
+memory allocated by Python and numpy while the stage runs (tracemalloc; Arrow
+buffers are not traced), measured in one extra, untimed run.
+
+Results can be written to a .json file (--json), and compared with the .json
+file of an earlier run (--baseline): benchmarks whose median time or peak
+memory grew by more than --tolerance are reported, and the exit status is 1.
+
+Usage:
+python benchmark.py startup
+python benchmark.py startup --repeat 10 --json startup.json
+python benchmark.py stages --rows 10000 100000 --json stages.json
+python benchmark.py stages --rows 10000 100000 --baseline stages.json --tolerance 0.25
+python benchmark.py generate --rows 1000000 --workdir bench_data
+'''
+
+import argparse
+import contextlib
+import io
+import json
+import numpy as np
+import os
+import pandas as pd
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# command line entry points timed by the startup benchmark
+SCRIPTS = ["main.py", "batch.py", "flexibility.py", "add_randomeffects.py", "describe.py", "generate_bow.py"]
+
+# language code of the synthetic data (no language-specific amendments)
+BENCH_LANG = "it"
+
+# synthetic words are strings of CV syllables
+CONSONANTS = "ptkbdgmnlrsfv"
+VOWELS = "aeiou"
+POS_WEIGHTS = {"NOUN": 0.3, "ADJ": 0.2, "VERB": 0.2, "DET": 0.15, "ADP": 0.15}
+
+# columns of a Common Voice validated.tsv
+CV_COLUMNS = ["client_id", "path", "sentence", "up_votes", "down_votes", "age", "gender", "accents", "locale", "segment"]
+
+
+def time_command(argv, repeat=5):
+    '''
+    Runs a command repeat times in a fresh process.
+    Returns the median and minimum wall time in seconds.
+    '''
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(argv, cwd=HERE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), min(times)
+
+
+def startup_benchmark(repeat=5):
+    '''
+    Startup time of every script's --help, and of the bare interpreter
+    as a reference. Returns a list of result dictionaries.
+    '''
+    results = []
+    commands = [("python", [sys.executable, "-c", "pass"])]
+    commands += [(script, [sys.executable, script, "--help"]) for script in SCRIPTS]
+    for name, argv in commands:
+        median, best = time_command(argv, repeat=repeat)
+        results.append({"benchmark": "startup", "name": name, "median_s": round(median, 4), "min_s": round(best, 4)})
+        print(f"{name:<22} median {median:.3f}s  min {best:.3f}s")
+    return results
+
+
+def synthetic_vocab(n_lemmas=5000, seed=0):
+    '''
+    Vocabulary of n_lemmas random lemmas made of 1-4 CV syllables, each with
+    a part of speech (see POS_WEIGHTS). Nouns and adjectives also get a
+    plural form (last vowel changed).
+    Returns a dataframe with columns word, lemma, pos, phonological_form
+    (syllables separated by '.') and p, the Zipfian probability of the word.
+    '''
+    rng = np.random.default_rng(seed)
+    syllables = [c + v for c in CONSONANTS for v in VOWELS]
+    tags = rng.choice(list(POS_WEIGHTS), size=n_lemmas, p=list(POS_WEIGHTS.values()))
+    lengths = rng.integers(1, 5, size=n_lemmas)
+
+    entries = []
+    seen = set()
+    for pos, length in zip(tags, lengths):
+        syls = [syllables[i] for i in rng.integers(len(syllables), size=length)]
+        while "".join(syls) in seen:
+            syls.append(syllables[rng.integers(len(syllables))])
+        lemma = "".join(syls)
+        seen.add(lemma)
+        entries.append((lemma, lemma, pos, ".".join(syls)))
+        if pos in ("NOUN", "ADJ"):
+            plural_syls = syls[:-1] + [syls[-1][0] + ("i" if syls[-1][1] != "i" else "e")]
+            plural = "".join(plural_syls)
+            if plural not in seen:
+                seen.add(plural)
+                entries.append((plural, lemma, pos, ".".join(plural_syls)))
+
+    vocab = pd.DataFrame(entries, columns=["word", "lemma", "pos", "phonological_form"])
+    ranks = rng.permutation(len(vocab)) + 1
+    vocab["p"] = (1 / ranks) / (1 / ranks).sum()
+
+    return vocab
+
+
+def sample_sentences(rows, vocab, seed=0):
+    '''
+    Draws the sentences of rows recordings. As in Common Voice, sentences
+    are repeated: rows // 2 unique sentences of 4-12 words.
+    Returns the word indices of all unique sentences, the offsets of every
+    unique sentence in them, and the unique sentence of every row.
+    '''
+    rng = np.random.default_rng(seed + 1)
+    n_unique = max(1, rows // 2)
+    lengths = rng.integers(4, 13, size=n_unique)
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    word_ids = rng.choice(len(vocab), size=offsets[-1], p=vocab["p"].values)
+    sentence_ids = rng.integers(n_unique, size=rows)
+
+    return word_ids, offsets, sentence_ids
+
+
+def write_synthetic_corpus(path, rows, vocab, seed=0, block=100000):
+    '''
+    Writes a Common Voice validated.tsv of rows recordings to path.
+    '''
+    word_ids, offsets, sentence_ids = sample_sentences(rows, vocab, seed)
+    words = vocab["word"].values[word_ids].tolist()
+    sentences = [" ".join(words[offsets[i]:offsets[i+1]]).capitalize() + "."
+                 for i in range(len(offsets) - 1)]
+    clients = np.random.default_rng(seed + 2).integers(max(1, rows // 50), size=rows)
+
+    with open(path, 'w', encoding='utf8') as f:
+        f.write("\t".join(CV_COLUMNS) + "\n")
+        for start in range(0, rows, block):
+            f.writelines(f"client{clients[row]}\tcommon_voice_{BENCH_LANG}_{row}.mp3\t{sentences[sentence_ids[row]]}\t2\t0\t\t\t\t{BENCH_LANG}\t\n"
+                         for row in range(start, min(start + block, rows)))
+
+
+def synthetic_tagged(rows, vocab, seed=0):
+    '''
+    Tagged data of the corpus written by write_synthetic_corpus() (same rows
+    and seed), as the tag stage would output it with StubTagger.
+    Returns a dataframe with columns client_id, audio_file, sentence,
+    lemmas and POS_tags.
+    '''
+    word_ids, offsets, sentence_ids = sample_sentences(rows, vocab, seed)
+    words = vocab["word"].values[word_ids].tolist()
+    lemmas = vocab["lemma"].values[word_ids].tolist()
+    tags = vocab["pos"].values[word_ids].tolist()
+    bounds = list(zip(offsets[:-1], offsets[1:]))
+    clients = np.random.default_rng(seed + 2).integers(max(1, rows // 50), size=rows)
+
+    return pd.DataFrame({
+        "client_id": [f"client{c}" for c in clients],
+        "audio_file": [f"common_voice_{BENCH_LANG}_{row}.mp3" for row in range(rows)],
+        "sentence": [" ".join(words[slice(*bounds[s])]).capitalize() for s in sentence_ids],
+        "lemmas": [lemmas[slice(*bounds[s])] for s in sentence_ids],
+        "POS_tags": [tags[slice(*bounds[s])] for s in sentence_ids],
+    })
+
+
+def synthetic_lexicon(vocab, seed=0, coverage=0.95, duplicates=0.02):
+    '''
+    Lexicon of the vocabulary: a coverage fraction of its words with their
+    phonological forms, followed by alternative pronunciations of a
+    duplicates fraction of them (later entries, not used by get_pforms()).
+    Returns a dataframe with columns word and phonological_form.
+    '''
+    rng = np.random.default_rng(seed + 3)
+    lexicon = vocab.loc[rng.random(len(vocab)) < coverage, ["word", "phonological_form"]]
+    alternatives = lexicon.sample(frac=duplicates, random_state=seed)
+    alternatives = alternatives.assign(phonological_form=alternatives["phonological_form"].str.replace(".", "", regex=False))
+
+    return pd.concat([lexicon, alternatives], ignore_index=True)
+
+
+def synthetic_constraints(n=8):
+    '''
+    n constraints on "form1#form2" strings of the synthetic phonological forms,
+    as (regex, name) pairs: a few general ones (one with a backreference,
+    which ConstraintSet checks separately), then one per syllable at the
+    end of the first word.
+    '''
+    constraints = [
+        (r"^[^#]*\.[^#]*\.[^#]*#", "long_first"),
+        (r"a#", "a_final"),
+        (r"#[ptk]", "voiceless_onset"),
+        (r"(\w)#\1", "identical"),
+        (r"[iu]#[iu]", "high_hiatus"),
+    ]
+    syllables = [c + v for c in CONSONANTS for v in VOWELS]
+    constraints += [(f"{syl}#", f"{syl}_final") for syl in syllables]
+
+    return constraints[:n]
+
+
+def generate_data(rows, workdir, vocab_size=5000, seed=0):
+    '''
+    Writes the synthetic data of one scale to {workdir}/rows_{rows}_vocab_{vocab_size}_seed_{seed}
+    (unless it is there already): {lang}/validated.tsv, tagged_{lang}.parquet,
+    lexicon.csv and constraints.tsv.
+    Returns a dictionary with the vocabulary and the paths.
+    '''
+    from data_io import write_data
+
+    directory = os.path.join(workdir, f"rows_{rows}_vocab_{vocab_size}_seed_{seed}")
+    data = {
+        "vocab": synthetic_vocab(vocab_size, seed),
+        "dir": directory,
+        "corpus": os.path.join(directory, BENCH_LANG, "validated.tsv"),
+        "tagged": os.path.join(directory, f"tagged_{BENCH_LANG}.parquet"),
+        "lexicon": os.path.join(directory, "lexicon.csv"),
+        "constraints": os.path.join(directory, "constraints.tsv"),
+    }
+    if all(os.path.exists(data[name]) for name in ["corpus", "tagged", "lexicon", "constraints"]):
+        return data
+
+    print(f"Generating synthetic data ({rows} rows) in {directory}...")
+    os.makedirs(os.path.dirname(data["corpus"]), exist_ok=True)
+    write_synthetic_corpus(data["corpus"], rows, data["vocab"], seed)
+    write_data(synthetic_tagged(rows, data["vocab"], seed), data["tagged"])
+    synthetic_lexicon(data["vocab"], seed).to_csv(data["lexicon"], index=False)
+    with open(data["constraints"], 'w', encoding='utf8') as f:
+        f.writelines(f"{regex}\t{name}\n" for regex, name in synthetic_constraints())
+
+    return data
+
+
+class StubToken:
+    __slots__ = ("text", "lemma_", "pos_")
+
+    def __init__(self, text, lemma, pos):
+        self.text = text
+        self.lemma_ = lemma
+        self.pos_ = pos
+
+
+class StubTagger:
+    '''
+    Offline stand-in for a spaCy model, with the part of its interface the
+    pipeline uses (calling it on a text, pipe(), lang and meta): words are split
+    on whitespace and tagged by lookup in the synthetic vocabulary.
+    Unknown words are tagged X.
+    '''
+
+    def __init__(self, vocab):
+        self.entries = dict(zip(vocab["word"], zip(vocab["lemma"], vocab["pos"])))
+        self.lang = BENCH_LANG
+        self.meta = {"lang": BENCH_LANG, "name": "stub", "version": str(len(self.entries))}
+
+    def __call__(self, text):
+        tokens = []
+        for word in text.split():
+            lemma, pos = self.entries.get(word.lower(), (word.lower(), "X"))
+            tokens.append(StubToken(word, lemma, pos))
+        return tokens
+
+    def pipe(self, texts, batch_size=1000, n_process=1):
+        for text in texts:
+            yield self(text)
+
+
+def time_call(run, setup=lambda: None, repeat=3):
+    '''
+    Times run(setup()) repeat times, without its progress messages (the
+    input is made by setup() before the clock starts), then runs it once
+    more to measure its peak memory.
+    Returns the median and minimum wall time in seconds, the peak memory
+    in MB and the result of the last run.
+    '''
+    times = []
+    for _ in range(repeat):
+        data = setup()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            run(data)
+            times.append(time.perf_counter() - start)
+
+    data = setup()
+    tracemalloc.start()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = run(data)
+    peak = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+
+    return statistics.median(times), min(times), peak, result
+
+
+def stages_benchmark(rows_list, workdir, vocab_size=5000, seed=0, repeat=3):
+    '''
+    Time and peak memory of every stage in isolation (on in-memory data,
+    every stage's input is the previous stage's output), and of the stage
+    graph end to end, for every number of rows in rows_list.
+    Returns a list of result dictionaries.
+    '''
+    import main
+    import POS_tag
+    from add_constraints import add_constraints_to_df, read_constraint_file
+    from add_pforms import build_index, get_pforms
+    from generate_bow import build_matrix, populate_matrix
+    from pipeline import run_stages
+    from select_data import find_sequences
+
+    results = []
+    for rows in rows_list:
+        data = generate_data(rows, workdir, vocab_size=vocab_size, seed=seed)
+        tagger = StubTagger(data["vocab"])
+        corpus = main.make_df(data["corpus"])
+        lexicon = pd.read_csv(data["lexicon"])
+        cons = read_constraint_file(data["constraints"])
+
+        def bow(df):
+            adj_dict, lexicon_dict = build_matrix(df)
+            return populate_matrix(adj_dict, lexicon_dict, df, threshold=2)
+
+        tagged = synthetic_tagged(rows, data["vocab"], seed)
+        stages = [
+            ("tag", lambda df: POS_tag.tag_df(df, BENCH_LANG, model=tagger), corpus),
+            ("select", lambda df: find_sequences(df, main.SEQUENCES, BENCH_LANG), tagged),
+            ("pforms", lambda df: get_pforms(df, build_index(lexicon), BENCH_LANG), None),
+            ("constraints", lambda df: add_constraints_to_df(df, cons, BENCH_LANG), None),
+            ("bow", bow, None),
+        ]
+        previous = None
+        for name, run, data_in in stages:
+            data_in = previous if data_in is None else data_in
+            median, best, peak, result = time_call(run, setup=lambda: data_in.copy(), repeat=repeat)
+            results.append(stage_result(name, rows, median, best, peak))
+            previous = result
+
+        # end to end, from the corpus file, with the stub tagger loaded
+        # in place of the language's spaCy model
+        POS_tag._MODELS[BENCH_LANG] = tagger
+        outdir = os.path.join(data["dir"], "run")
+        os.makedirs(outdir, exist_ok=True)
+        args = main.build_parser().parse_args([data["dir"] + os.sep, "--lang", BENCH_LANG,
+            "--lexicon", data["lexicon"], "--constraints", data["constraints"], "--outdir", outdir])
+        end_to_end = lambda _: run_stages(main.STAGES, ("ingest", data["corpus"]), args, BENCH_LANG, outdir=outdir, force=True)
+        median, best, peak, _ = time_call(end_to_end, repeat=repeat)
+        results.append(stage_result("end_to_end", rows, median, best, peak))
+        del POS_tag._MODELS[BENCH_LANG]
+
+    return results
+
+
+def stage_result(name, rows, median, best, peak):
+    print(f"{name:<12} {rows:>9} rows  median {median:.3f}s  min {best:.3f}s  peak {peak:.1f}MB")
+    return {"benchmark": "stages", "name": name, "rows": rows,
+            "median_s": round(median, 4), "min_s": round(best, 4), "peak_mb": round(peak, 2)}
+
+
+def compare(results, baseline, tolerance=0.2):
+    '''
+    Compares results with the results of an earlier run (matched by benchmark,
+    name and rows) and prints the ratios of median time and peak memory.
+    Returns the results whose median time or peak memory grew by more than
+    tolerance (a fraction of the baseline).
+    '''
+    key = lambda result: (result["benchmark"], result["name"], result.get("rows"))
+    earlier = {key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        base = earlier.get(key(result))
+        if base is None:
+            continue
+        ratios = {measure: result[measure] / base[measure]
+                  for measure in ["median_s", "peak_mb"] if measure in result and base.get(measure)}
+        slower = [measure for measure, ratio in ratios.items() if ratio > 1 + tolerance]
+        flag = "  REGRESSION" if slower else ""
+        print(f"{result['name']:<12} {result.get('rows') or '':>9}  " + "  ".join(f"{measure} {ratio:.2f}x" for measure, ratio in ratios.items()) + flag)
+        if slower:
+            regressions.append(result)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("benchmark", choices=["startup", "stages", "generate"],
+    help="Benchmark to run, or generate to only write the synthetic data.")
+    parser.add_argument("--repeat", type=int, default=None,
+    help="Number of runs of every command or stage. (Default: 5 for startup, 3 for stages)")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000],
+    help="Number(s) of corpus rows of the synthetic data. (Default: 10000)")
+    parser.add_argument("--vocab", type=int, default=5000,
+    help="Number of lemmas of the synthetic vocabulary. (Default: 5000)")
+    parser.add_argument("--seed", type=int, default=0,
+    help="Seed of the synthetic data. (Default: 0)")
+    parser.add_argument("--workdir", default="bench_data",
+    help="Directory of the synthetic data and end-to-end runs. (Default: bench_data)")
+    parser.add_argument("--json", default=None,
+    help="Write the results to this .json file. (Default: None)")
+    parser.add_argument("--baseline", default=None,
+    help="Compare the results with this .json file of an earlier run. (Default: None)")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+    help="Fraction by which a benchmark may be slower (or use more memory) than the baseline. (Default: 0.2)")
+    args = parser.parse_args()
+
+    if args.benchmark == "generate":
+        for rows in args.rows:
+            generate_data(rows, args.workdir, vocab_size=args.vocab, seed=args.seed)
+        sys.exit()
+    elif args.benchmark == "stages":
+        results = stages_benchmark(args.rows, args.workdir, vocab_size=args.vocab, seed=args.seed, repeat=args.repeat or 3)
+    else:
+        results = startup_benchmark(repeat=args.repeat or 5)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            regressions = compare(results, json.load(f), tolerance=args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} benchmark(s) regressed by more than {args.tolerance:.0%}.")
+            sys.exit(1)
@@ -0,0 +1,218 @@
+'''
+Compact, integer-coded representation of a tagged corpus.
+
+Lemmas and POS (UPOS) tags are interned in vocabularies (Vocabulary: string
+<-> integer code), and the sentences of a corpus are stored as flat int32
+arrays of lemma and tag codes, one entry per token, with the offset of every
+sentence (CSR-style): the tokens of sentence i are
+lemmas[offsets[i]:offsets[i+1]]. Scans over the whole corpus (e.g., for POS
+sequences, or co-occurrence counts) are then NumPy operations on these arrays,
+instead of Python loops over one list object per row.
+
+Corpora are built from the lemmas and POS_tags list columns of a dataframe
+(Corpus.from_df()), or straight from the list columns of a parquet file,
+without building Python lists (iter_corpus()).
+Used by select_data, generate_bow and flexibility.
+'''
+
+import itertools
+import numpy as np
+import pandas as pd
+
+from data_io import LIST_COLUMNS, iter_data, parse_list
+
+
+class Vocabulary:
+    '''
+    Interned strings: items[code] is the string of a code,
+    index[string] the code of a string. Codes are given in order of
+    first occurrence, and a vocabulary only grows, so it can be shared by
+    all chunks of a corpus.
+    '''
+
+    def __init__(self, items=()):
+        self.index = {}
+        self.items = []
+        self._array = None
+        self.add(items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, item):
+        return item in self.index
+
+    def add(self, items):
+        '''
+        Adds the new ones of (distinct) items.
+        Returns the codes of all items, as an int32 array.
+        '''
+        codes = np.empty(len(items), dtype=np.int32)
+        for i, item in enumerate(items):
+            code = self.index.get(item)
+            if code is None:
+                code = self.index[item] = len(self.items)
+                self.items.append(item)
+                self._array = None
+            codes[i] = code
+        return codes
+
+    def encode(self, values):
+        '''
+        Codes of a flat array (or list) of strings, as an int32 array.
+        Only the distinct values are looked up.
+        '''
+        labels, uniques = pd.factorize(np.asarray(values, dtype=object), use_na_sentinel=False)
+        return self.add(list(uniques))[labels]
+
+    def get(self, item, default=-1):
+        return self.index.get(item, default)
+
+    def decode(self, codes):
+        '''
+        Strings of an array of codes, as an object array.
+        '''
+        if self._array is None:
+            self._array = np.array(self.items, dtype=object)
+        return self._array[codes]
+
+
+class Corpus:
+    '''
+    Sentences as flat int32 arrays of lemma and tag codes, with offsets
+    (see module docstring).
+    columns holds the column order of the dataframe the corpus was read
+    with, if its lemmas and POS_tags columns were left out (see iter_corpus()).
+    '''
+
+    def __init__(self, lemmas, tags, offsets, lemma_vocab, tag_vocab, columns=None):
+        self.lemmas = lemmas
+        self.tags = tags
+        self.offsets = offsets
+        self.lemma_vocab = lemma_vocab
+        self.tag_vocab = tag_vocab
+        self.columns = columns
+
+    @classmethod
+    def from_lists(cls, lemma_lists, tag_lists, lemma_vocab=None, tag_vocab=None):
+        '''
+        Corpus of a list of lemma lists and a list of tag lists (one per sentence).
+        '''
+        lemma_vocab = lemma_vocab if lemma_vocab is not None else Vocabulary()
+        tag_vocab = tag_vocab if tag_vocab is not None else Vocabulary()
+        lengths = np.fromiter((len(tags) for tags in tag_lists), dtype=np.int64, count=len(tag_lists))
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        lemmas = lemma_vocab.encode(list(itertools.chain.from_iterable(lemma_lists)))
+        tags = tag_vocab.encode(list(itertools.chain.from_iterable(tag_lists)))
+        return cls(lemmas, tags, offsets, lemma_vocab, tag_vocab)
+
+    @classmethod
+    def from_df(cls, df, lemma_vocab=None, tag_vocab=None):
+        '''
+        Corpus of the lemmas and POS_tags columns of a dataframe.
+        '''
+        return cls.from_lists(df["lemmas"].map(parse_list).tolist(), df["POS_tags"].map(parse_list).tolist(),
+                              lemma_vocab, tag_vocab)
+
+    @classmethod
+    def from_arrow(cls, lemma_column, tag_column, lemma_vocab=None, tag_vocab=None):
+        '''
+        Corpus of two pyarrow list<string> arrays (lemmas and POS tags),
+        e.g., columns of a parquet record batch. No Python lists are built:
+        the string values are dictionary-encoded by Arrow, and only the
+        distinct strings are looked up in the vocabularies.
+        '''
+        lemma_vocab = lemma_vocab if lemma_vocab is not None else Vocabulary()
+        tag_vocab = tag_vocab if tag_vocab is not None else Vocabulary()
+        offsets = tag_column.offsets.to_numpy().astype(np.int64)
+        offsets -= offsets[0]
+
+        def encode(column, vocab):
+            encoded = column.flatten().dictionary_encode()
+            local_codes = encoded.indices.to_numpy(zero_copy_only=False)
+            return vocab.add(encoded.dictionary.to_pylist())[local_codes]
+
+        return cls(encode(lemma_column, lemma_vocab), encode(tag_column, tag_vocab), offsets, lemma_vocab, tag_vocab)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    @property
+    def nbytes(self):
+        return self.lemmas.nbytes + self.tags.nbytes + self.offsets.nbytes
+
+    def rows(self):
+        '''
+        Sentence number of every token.
+        '''
+        return np.repeat(np.arange(len(self)), self.lengths)
+
+    def positions(self):
+        '''
+        Position of every token in its sentence.
+        '''
+        return np.arange(len(self.tags)) - np.repeat(self.offsets[:-1], self.lengths)
+
+    def token_index(self, rows):
+        '''
+        Indices of the tokens of the given sentences, in order,
+        and the number of tokens of every sentence.
+        '''
+        rows = np.asarray(rows, dtype=np.int64)
+        lengths = self.lengths[rows]
+        starts = self.offsets[rows]
+        ends = np.cumsum(lengths)
+        index = np.arange(ends[-1] if len(ends) else 0) - np.repeat(ends - lengths - starts, lengths)
+        return index, lengths
+
+    def lemma_lists(self, rows):
+        '''
+        Lemmas of the given sentences, as one list of strings per sentence.
+        '''
+        return self._lists(self.lemmas, self.lemma_vocab, rows)
+
+    def tag_lists(self, rows):
+        '''
+        POS tags of the given sentences, as one list of strings per sentence.
+        '''
+        return self._lists(self.tags, self.tag_vocab, rows)
+
+    def _lists(self, codes, vocab, rows):
+        index, lengths = self.token_index(rows)
+        values = vocab.decode(codes[index])
+        return [part.tolist() for part in np.split(values, np.cumsum(lengths)[:-1])] if len(lengths) else []
+
+
+def iter_corpus(path, chunksize=100000, lemma_vocab=None, tag_vocab=None):
+    '''
+    Read a tagged dataset from a .parquet or .csv file in chunks of (at most)
+    chunksize sentences. Yields (dataframe, corpus) pairs: the corpus holds the
+    lemmas and POS tags of the chunk (all chunks share the vocabularies), the
+    dataframe all other columns.
+    From parquet, the lemmas and POS_tags columns are read straight into
+    the corpus (see Corpus.from_arrow()).
+    '''
+    lemma_vocab = lemma_vocab if lemma_vocab is not None else Vocabulary()
+    tag_vocab = tag_vocab if tag_vocab is not None else Vocabulary()
+    if path.endswith(".parquet"):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(path)
+        columns = parquet_file.schema_arrow.names
+        for batch in parquet_file.iter_batches(batch_size=chunksize):
+            corpus = Corpus.from_arrow(batch.column("lemmas"), batch.column("POS_tags"), lemma_vocab, tag_vocab)
+            corpus.columns = columns
+            df = pa.Table.from_batches([batch]).drop_columns(["lemmas", "POS_tags"]).to_pandas()
+            for col in LIST_COLUMNS:
+                if col in df.columns:
+                    df[col] = df[col].map(parse_list)
+            yield df, corpus
+    else:
+        for df in iter_data(path, chunksize=chunksize):
+            corpus = Corpus.from_df(df, lemma_vocab, tag_vocab)
+            corpus.columns = list(df.columns)
+            yield df.drop(columns=["lemmas", "POS_tags"]), corpus
@@ -0,0 +1,175 @@
+'''
+Reading and writing of the pipeline's intermediate datasets
+(tagged_*, targets_*, dataset_* and output_* files).
+
+Datasets are stored as Parquet, which keeps the list columns (lemmas, POS tags,
+target tokens/lemmas/tags) as native list columns. CSV is still supported for
+R and for files written by earlier versions of the pipeline: list columns are
+then written as Python reprs, and are parsed back once, when the file is read.
+
+Parquet requires pyarrow (pip install pyarrow).
+'''
+
+import os
+import pandas as pd
+
+from ast import literal_eval
+
+
+# columns holding one list per row
+LIST_COLUMNS = ["lemmas", "POS_tags", "BW", "target_tokens", "target_lemmas", "target_tags"]
+
+
+def parse_list(value):
+    '''
+    Convert a list column value read from file back to a list.
+    Missing values are left as they are.
+    '''
+    if isinstance(value, list):
+        return value
+    if isinstance(value, str):
+        return literal_eval(value)
+    if hasattr(value, "tolist"): # numpy arrays from parquet
+        return value.tolist()
+    return value
+
+
+def read_data(path):
+    '''
+    Read a dataset from a .parquet or .csv file.
+    Returns a dataframe where every list column holds Python lists.
+    '''
+    if path.endswith(".parquet"):
+        df = pd.read_parquet(path)
+    else:
+        df = pd.read_csv(path)
+
+    for col in LIST_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].map(parse_list)
+
+    return df
+
+
+def iter_data(path, chunksize=100000):
+    '''
+    Read a dataset from a .parquet or .csv file in chunks of (at most)
+    chunksize rows. Yields dataframes where every list column holds
+    Python lists.
+    '''
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        chunks = (batch.to_pandas() for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize))
+    else:
+        chunks = pd.read_csv(path, chunksize=chunksize)
+
+    for df in chunks:
+        for col in LIST_COLUMNS:
+            if col in df.columns:
+                df[col] = df[col].map(parse_list)
+        yield df
+
+
+def count_rows(path):
+    '''
+    Number of rows of a dataset file, .parquet (from its metadata)
+    or .csv (read in chunks).
+    '''
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(path).metadata.num_rows
+    return sum(len(chunk) for chunk in pd.read_csv(path, chunksize=100000))
+
+
+def write_data(df, path, csv_copy=False):
+    '''
+    Write a dataset to path; the format follows the file extension,
+    .parquet or .csv.
+    If csv_copy, a .csv file with the same name is also written (for R).
+    '''
+    root, ext = os.path.splitext(path)
+    if ext == ".parquet":
+        df.to_parquet(path, index=False)
+        if csv_copy:
+            df.to_csv(path_or_buf=root + ".csv", index=False)
+    else:
+        df.to_csv(path_or_buf=path, index=False)
+
+
+class DataWriter:
+    '''
+    Writes a dataset to path chunk by chunk, so it never has to be held
+    in memory as a whole. The format follows the file extension,
+    .parquet or .csv; if csv_copy, a .csv copy is written alongside.
+    Empty chunks are only written if all chunks are empty, so that the
+    parquet schema comes from a chunk with data; a file is always written.
+    The parquet schema is that of the first chunk with data; if a later chunk
+    does not fit it (e.g., strings in a column that was all missing, or
+    non-integral floats in an integer column), the schema is promoted to one
+    that fits both, and the rows written so far are rewritten with it.
+    '''
+
+    def __init__(self, path, csv_copy=False):
+        root, ext = os.path.splitext(path)
+        self.path = path
+        self.parquet = ext == ".parquet"
+        self.csv_path = root + ".csv" if (csv_copy or not self.parquet) else None
+        self.writer = None
+        self.schema = None
+        self.header = True
+        self.rows = 0
+        self.written = False
+        self.empty = None
+
+    def write(self, df):
+        if len(df) == 0:
+            if self.empty is None:
+                self.empty = df
+            return
+        self._write(df)
+
+    def _write(self, df):
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self.writer is None:
+                self.schema = table.schema
+                self.writer = pq.ParquetWriter(self.path, self.schema)
+            elif not table.schema.equals(self.schema):
+                table = table.select(self.schema.names)
+                try:
+                    table = table.cast(self.schema)
+                except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                    self._promote(table.schema)
+                    table = table.cast(self.schema)
+            self.writer.write_table(table)
+        if self.csv_path is not None:
+            df.to_csv(path_or_buf=self.csv_path, index=False, header=self.header, mode='w' if self.header else 'a')
+            self.header = False
+        self.rows += len(df)
+        self.written = True
+
+    def _promote(self, schema):
+        '''
+        Promotes the parquet schema to one that also fits schema, and
+        rewrites the rows written so far with it.
+        '''
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        promoted = pa.unify_schemas([self.schema, schema], promote_options="permissive")
+        promoted = promoted.remove_metadata() # pandas dtypes of the first chunk
+        self.writer.close()
+        tmp_path = self.path + ".promote"
+        os.replace(self.path, tmp_path)
+        self.schema = promoted
+        self.writer = pq.ParquetWriter(self.path, self.schema)
+        for batch in pq.ParquetFile(tmp_path).iter_batches():
+            self.writer.write_table(pa.Table.from_batches([batch]).cast(self.schema))
+        os.remove(tmp_path)
+
+    def close(self):
+        if not self.written:
+            self._write(self.empty if self.empty is not None else pd.DataFrame())
+        if self.writer is not None:
+            self.writer.close()
@@ -15,56 +15,54 @@ import numpy as np
 import pandas as pd
 import sys
 
-from ast import literal_eval
-from scipy import stats
 from add_constraints import read_constraint_file
-from add_constraints import evaluate
+from add_constraints import ConstraintSet, pair_columns
+from data_io import read_data
+from features import FeatureStore
 
 
 
-def length_stats(pforms):
+def length_stats(pforms, store=None):
     '''
     Mean, median, and mode of syllable counts in a list of words.
+    Syllable counts are looked up in a FeatureStore (a new one if none
+    is given), counted once per word.
     Prints the results rather than returns.
     '''
+    if store is None:
+        store = FeatureStore()
+    codes = np.unique(store.encode(list(pforms), strip=False))
+    syl_count = store.syllables[codes]
 
-    syl_count = []
-    for index, pform in enumerate(pforms):
-        syls = pform.count('.') + 1
-        syl_count.append(syls)
-
-    monos = syl_count.count(1)
+    monos = int((syl_count == 1).sum())
     mean = np.mean(syl_count)
     median = np.median(syl_count)
-    mode = stats.mode(syl_count).mode[0]
-    count = stats.mode(syl_count).count[0]
-    freq = (count/len(pforms))*100
+    counts = np.bincount(syl_count)
+    mode = int(counts.argmax()) # smallest of the most frequent counts
+    freq = (counts[mode]/len(codes))*100
 
     print("The mean syllable count of a word is " + str(mean)[:4])
     print("The median syllable count of a word is " + str(median))
     print("The most frequent syllable count (mode) is " + str(mode) + ", appearing in " + str(freq)[:5] + "% of data")
-    print("There are " + str(monos) + " monosyllabic words (" + str((monos/len(pforms))*100)[:4] + "%)")
+    print("There are " + str(monos) + " monosyllabic words (" + str((monos/len(codes))*100)[:4] + "%)")
 
 
-def shape_stats(cons,pforms):
+def shape_stats(cons, pforms, store=None):
     '''
     How many words in the list violate the provided constraints.
+    Word-level violations are looked up in a FeatureStore (a new one if
+    none is given): all constraints are evaluated in one scan per word
+    (see ConstraintSet), once per word.
     Prints the results rather than returns.
     '''
-
-    # evaluate all data for one phonological constraint at a time
-    for constraint in cons:
-        violations = []
-
-        con_name = constraint
-        con_regex = cons[con_name]
-
-        for index, pform in enumerate(pforms):
-            outcome = evaluate(con_regex,pform)
-            violations.append(outcome)
-
-        positives = violations.count(1)
-        all = len(violations)
+    if store is None:
+        store = FeatureStore()
+    codes = np.unique(store.encode(list(pforms), strip=False))
+    violations = store.violations(ConstraintSet(cons))[codes]
+
+    for ix, con_name in enumerate(cons):
+        positives = int(violations[:, ix].sum())
+        all = len(codes)
         percentage = (positives/all)*100
 
         print(str(positives) + " out of " + str(all) + " words (" + str(percentage)[:4] + "%) are " + con_name)
@@ -75,38 +73,31 @@ if __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
     parser.add_argument("input_file",  
-    help="Give path of the directory with data. Must be .csv.")
+    help="Give path of the directory with data. Must be .parquet or .csv.")
     parser.add_argument("constraint_file",
     help="Give path of the directory with constraints. Must be .tsv.")
     args = parser.parse_args()
 
     # read in data from file as pandas df
-    df = pd.read_csv(args.input_file)
+    df = read_data(args.input_file)
 
     # generate adjective and noun lists to evaluate descriptive stats over
-    adjs = []
-    nouns = []
-    for index,row in df.iterrows():
-        order = row["target_tags"]
-        if type(order) != list:
-            order = literal_eval(order)
-        
-        if order[0] == "NOUN":
-            adjs.append(row["pform2"])
-            nouns.append(row["pform1"])
-        else:
-            adjs.append(row["pform1"])
-            nouns.append(row["pform2"])
+    prenominal = pair_columns(df)["prenominal"].values == 1
+    adjs = np.where(prenominal, df["pform1"].values, df["pform2"].values)
+    nouns = np.where(prenominal, df["pform2"].values, df["pform1"].values)
 
     # read in constraint file
     cons = read_constraint_file(args.constraint_file)
 
+    # features of every word, shared by all statistics
+    store = FeatureStore()
+
     print("-------------- ADJECTIVES --------------")
-    length_stats(set(adjs))
+    length_stats(adjs, store)
     print('----------------------------------------')
-    shape_stats(cons,set(adjs))
+    shape_stats(cons, adjs, store)
     
     print("---------------- NOUNS -----------------")
-    length_stats(set(nouns))
+    length_stats(nouns, store)
     print('----------------------------------------')
-    shape_stats(cons,set(nouns))
\ No newline at end of file
+    shape_stats(cons, nouns, store)
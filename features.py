@@ -0,0 +1,86 @@
+'''
+Per-word phonological feature store.
+
+Every distinct word form (phonological form, or Arabic CV form) is coded once
+as an integer, and its features are computed once and kept in arrays indexed
+by that code:
+- syllables: syllable count ('.' assumed as syllable boundary marker)
+- cv: code of its CV form, if one was given (Arabic CV_form1/CV_form2), else -1
+- word-level violations of a ConstraintSet (see violations())
+
+Columns of a dataset are encoded with encode(): the column is factorized, and
+only its distinct values are stripped, looked up and, if new, added to the
+store, so the store can be shared by all chunks of a dataset.
+Used by add_constraints (length_con, add_constraints_to_df) and describe.
+'''
+
+import numpy as np
+import pandas as pd
+
+
+class FeatureStore:
+    '''
+    Integer-coded word forms and their features, see module docstring.
+    forms[code] is the form of a code, codes[form] the code of a form.
+    '''
+
+    def __init__(self):
+        self.codes = {}
+        self.forms = np.empty(0, dtype=object)
+        self.syllables = np.empty(0, dtype=np.int32)
+        self.cv = np.empty(0, dtype=np.int64)
+        self._violations = {}
+
+    def __len__(self):
+        return len(self.forms)
+
+    def add(self, forms):
+        '''
+        Adds new distinct forms to the store, with their features.
+        '''
+        if not forms:
+            return
+        for form in forms:
+            self.codes[form] = len(self.codes)
+        new = np.array(forms, dtype=object)
+        self.forms = np.concatenate([self.forms, new])
+        syllables = pd.Series(new, dtype=object).str.count(r'\.').values + 1
+        self.syllables = np.concatenate([self.syllables, syllables.astype(np.int32)])
+        self.cv = np.concatenate([self.cv, np.full(len(new), -1, dtype=np.int64)])
+
+    def encode(self, forms, strip=True):
+        '''
+        Codes of a column (or list) of forms, as an integer array.
+        If strip, boundary markers around the forms are removed first
+        (as in pform1/pform2: ".ka.lo." -> "ka.lo").
+        '''
+        labels, uniques = pd.factorize(np.asarray(forms, dtype=object), use_na_sentinel=False)
+        uniques = pd.Series(uniques, dtype=object)
+        if strip:
+            uniques = uniques.str.strip('.').str.strip(' ')
+        uniques = uniques.tolist()
+        self.add(list(dict.fromkeys(form for form in uniques if form not in self.codes)))
+        unique_codes = np.array([self.codes[form] for form in uniques], dtype=np.int64)
+
+        return unique_codes[labels]
+
+    def set_cv_forms(self, codes, cv_codes):
+        '''
+        Records the CV form (code) of every form (code).
+        '''
+        self.cv[codes] = cv_codes
+
+    def violations(self, constraint_set):
+        '''
+        Word-level violations of a ConstraintSet by every form in the store:
+        boolean array of shape (#forms, #constraints). Every form is scanned
+        once per constraint set; later calls only scan forms added since.
+        '''
+        key = tuple((name, pattern.pattern) for name, pattern in zip(constraint_set.names, constraint_set.patterns))
+        known = self._violations.get(key, np.zeros((0, len(constraint_set)), dtype=bool))
+        if len(known) < len(self.forms):
+            new = constraint_set.violations(self.forms[len(known):].tolist())
+            known = np.concatenate([known, new])
+            self._violations[key] = known
+
+        return known
@@ -4,123 +4,102 @@ This script takes in a dataset output by main.py and generates three files:
 (2) Unique adjs with prenominal, postnominal, and total token frequencies; rate prenominal
 (3) Copy of original dataset, filtered for pairs containing a flexible adjective
 
+The same files are written by main.py --flexibility, as an optional stage
+after the constraints: the tables come from the pair counts written by the
+constraints stage, and the output is streamed once more to filter its rows.
+
 Usage:
 python flexibility.py data_file language_name
 python flexibility.py output_it.csv it
 '''
 
 import argparse
+import numpy as np
+import os
 import pandas as pd
 import sys
-from ast import literal_eval
+from add_constraints import pair_columns, pair_counts
+from corpus import Vocabulary
+from data_io import read_data, write_data
 
 
-def get_flex_rates(df):
+def lemma_totals(lemmas, prenominal, postnominal):
+    '''
+    Sums the prenominal and postnominal counts of every lemma: lemmas are
+    integer-coded (see corpus.Vocabulary) and summed with np.bincount.
+    Returns the distinct lemmas in order of first occurrence and their sums.
     '''
-    Takes a df and calculates:
+    vocab = Vocabulary()
+    codes = vocab.encode(lemmas)
+    prenominal = np.bincount(codes, weights=prenominal, minlength=len(vocab)).astype(np.int64)
+    postnominal = np.bincount(codes, weights=postnominal, minlength=len(vocab)).astype(np.int64)
+
+    return vocab.items, prenominal, postnominal
+
+
+def flex_tables(counts):
+    '''
+    Takes pair counts (see add_constraints.pair_counts()) and calculates:
     # tokens prenominal
     # tokens postnominal
     # total tokens
     rate prenominal
 
-    For Ns and As (lemmas).
+    For Ns and As (lemmas), in order of first occurrence.
 
-    Returns two dictionaries, one for Ns and one for As. 
+    Returns two dataframes:
+    nouns with columns noun, postadjectival, preadjectival, total, rate_postadjectival;
+    adjectives with columns adjective, prenominal, postnominal, total, rate_prenominal.
     '''
-    noun_dict = {}
-    adj_dict = {}
-
-    for index,row in df.iterrows():
-        # get POS
-        if type(row["target_tags"]) != list:
-            POS_seq = literal_eval(row["target_tags"])
-        else:
-            POS_seq = row["target_tags"]
-        # get lemmas
-        if type(row["target_lemmas"]) != list:
-            pair = literal_eval(row["target_lemmas"])
-        else:
-            pair = row["target_lemmas"]
-
-        # NOUN
-        if POS_seq[0] == 'NOUN': # postnominal
-            if pair[0] not in noun_dict.keys():
-                noun_dict[pair[0]] = [0,1]
-            else:
-                noun_dict[pair[0]][1] += 1 
-        else: # prenominal
-            if pair[1] not in noun_dict.keys():
-                noun_dict[pair[1]] = [1,0]
-            else:
-                noun_dict[pair[1]][0] += 1
-
-        # ADJ
-        if POS_seq[0] == 'ADJ': # prenominal
-            if pair[0] not in adj_dict.keys():
-                adj_dict[pair[0]] = [1,0]
-            else:
-                adj_dict[pair[0]][0] += 1 
-        else: # postnominal
-            if pair[1] not in adj_dict.keys():
-                adj_dict[pair[1]] = [0,1]
-            else:
-                adj_dict[pair[1]][1] += 1     
-
-    for noun in noun_dict.keys():
-        total = noun_dict[noun][0] + noun_dict[noun][1]
-        prenom_rate = noun_dict[noun][0] / total
-        noun_dict[noun].append(total)
-        noun_dict[noun].append(prenom_rate)
-
-    for adj in adj_dict.keys():
-        total = adj_dict[adj][0] + adj_dict[adj][1]
-        prenom_rate = adj_dict[adj][0] / total
-        adj_dict[adj].append(total)
-        adj_dict[adj].append(prenom_rate)
-
-    return noun_dict, adj_dict
-
-
-def flex_filter(df, adj_dict):
+    prenominal = counts["prenominal"].values
+    postnominal = counts["postnominal"].values
+
+    noun, postadjectival, preadjectival = lemma_totals(counts["noun_lemma"].values, prenominal, postnominal)
+    nouns = pd.DataFrame({'noun': noun, 'postadjectival': postadjectival, 'preadjectival': preadjectival})
+    nouns['total'] = nouns['postadjectival'] + nouns['preadjectival']
+    nouns['rate_postadjectival'] = nouns['postadjectival'] / nouns['total']
+
+    adjective, prenominal, postnominal = lemma_totals(counts["adj_lemma"].values, prenominal, postnominal)
+    adjs = pd.DataFrame({'adjective': adjective, 'prenominal': prenominal, 'postnominal': postnominal})
+    adjs['total'] = adjs['prenominal'] + adjs['postnominal']
+    adjs['rate_prenominal'] = adjs['prenominal'] / adjs['total']
+
+    return nouns, adjs
+
+
+def get_flex_rates(df):
+    '''
+    Takes a df of target sequences and lemmas and returns
+    the noun and adjective tables of flex_tables().
+    '''
+    return flex_tables(pair_counts(pair_columns(df)))
+
+
+def flex_filter(df, adjs):
     '''
-    Takes a dataframe of target sequences and lemmas,
-    returns a new dataframe with only sequences where the adjective
-    isn't strictly pre- or postnominal.
+    Takes a dataframe of target sequences and lemmas and the adjective table
+    of get_flex_rates(), returns a new dataframe with only sequences where the
+    adjective isn't strictly pre- or postnominal.
     '''
-    
-    flex_rows = []
-    
-    for index,row in df.iterrows():
-        # get POS
-        if type(row["target_tags"]) != list:
-            POS_seq = literal_eval(row["target_tags"])
-        else:
-            POS_seq = row["target_tags"]
-        # get lemmas
-        if type(row["target_lemmas"]) != list:
-            pair = literal_eval(row["target_lemmas"])
-        else:
-            pair = row["target_lemmas"]
-
-        # filter for flexible adjectives
-        if POS_seq[0] == "ADJ":
-            if (adj_dict[pair[0]][3] < 1.0) and (adj_dict[pair[0]][3] > 0.0):
-                flex_rows.append(row)
-        else:
-            if (adj_dict[pair[1]][3] < 1.0) and (adj_dict[pair[1]][3] > 0.0):
-                flex_rows.append(row)
-        
-    flex_df = pd.DataFrame(flex_rows)
-
-    return flex_df
+    flexible = adjs.loc[(adjs['rate_prenominal'] > 0.0) & (adjs['rate_prenominal'] < 1.0), 'adjective']
+    mask = pair_columns(df)["adj_lemma"].isin(flexible).values
+
+    return df[mask]
+
 
+def write_flex_tables(nouns, adjs, lang, outdir="."):
+    '''
+    Writes the noun and adjective tables to nouns_{lang}.csv and adjs_{lang}.csv.
+    '''
+    nouns.to_csv(os.path.join(outdir, f"nouns_{lang}.csv"), index=False)
+    adjs.to_csv(os.path.join(outdir, f"adjs_{lang}.csv"), index=False)
 
 
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
     parser.add_argument("input_file",  
-    help="Give path of the directory with data. Must be .csv.")
+    help="Give path of the directory with data. Must be .parquet or .csv.")
     parser.add_argument("language",
     help="Give language name for output files.")
     args = parser.parse_args()
@@ -128,18 +107,14 @@ if __name__ == "__main__":
     lang = args.language
 
     # read in data from file as pandas df
-    df = pd.read_csv(args.input_file)
+    df = read_data(args.input_file)
 
-    # create dictionaries of nouns and adjectives
-    nouns, adjectives = get_flex_rates(df)
-    # convert to dfs
-    nouns_df = pd.DataFrame(nouns, columns=['noun','postadjectival','preadjectival','total','rate_postadjectival'])
-    adjs_df = pd.DataFrame(adjectives, columns=['adjective','prenominal','postnominal','total','rate_prenominal'])
+    # tables of nouns and adjectives
+    nouns_df, adjs_df = get_flex_rates(df)
 
     # filter data for only targets that contain flexible adjectives
-    filtered_df = flex_filter(df, adjectives)
+    filtered_df = flex_filter(df, adjs_df)
 
     # write to file
-    nouns_df.to_csv(f"nouns_{lang}.csv", index=False)
-    adjs_df.to_csv(f"adjs_{lang}.csv", index=False)
-    filtered_df.to_csv(f"filtered_{lang}.csv", index=False)
\ No newline at end of file
+    write_flex_tables(nouns_df, adjs_df, lang)
+    write_data(filtered_df, f"filtered_{lang}{os.path.splitext(args.input_file)[1]}", csv_copy=True)
@@ -7,33 +7,41 @@ adjectives in their prenominal position and one of those in their postnominal
 position. 
 
 These count matrices are converted to PPMI, and are reduced to embeddings using
-PCA. Row-wise cosine similarity is measured between the prenominal and
+truncated SVD (or PCA, with --embedding pca). Row-wise cosine similarity is measured between the prenominal and
 postnominal matrices, generating an empirical measure of similarity between an
 adjective in its prenominal position and the same adjective in its postnominal
 position (e.g., <big> N vs. N <big>).
 
 Plots:
-- Explained variance of PCA embeddings
+- Explained variance of SVD/PCA embeddings
 - Gaussian mixture model of cosine similarities
 - Histogram of cosine similarities
 
+With --bootstrap and --permutations, every step is rerun on resampled
+sentences for confidence intervals and p-values (see resample_bow.py).
+
 Outputs:
 - cosines.csv : item and its cosine similarity between prenom and postnom
-representations
+representations; with --bootstrap, its confidence interval (ci_lower,
+ci_upper), and with --permutations, its p-value
 
 Usage:
 python generate_bow.py dataset.csv
+python generate_bow.py dataset.parquet --k 256 --seed 1
+python generate_bow.py dataset.parquet --bootstrap 1000 --permutations 1000 --workers 8
 '''
 
 import argparse
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 import sys
 
-from ast import literal_eval
-from collections import defaultdict
-from collections import OrderedDict
+from add_constraints import pair_columns
+from corpus import Corpus
+from data_io import read_data
+from scipy import sparse
+
+# matplotlib is slow to import, it is imported only when something is plotted
 
 
 def build_dict(word_list):
@@ -50,39 +58,24 @@ def build_dict(word_list):
     return word_dict
 
 
-def build_matrix(df):
+def build_matrix(df, corpus=None):
     '''
-    Creates two sets: adjective lemmas and all lemmas in the lexicon from
+    Creates two lists: adjective lemmas and all lemmas in the lexicon from
     dataframe, which has columns for target_lemmas, target_tags, and
-    sentence lemmas.
+    sentence lemmas, both in order of first occurrence.
+    The lexicon is read from the integer-coded corpus of the sentence
+    lemmas (see corpus.Corpus; built from df if not given).
     Uses helper function build_dict to convert these into dictionaries.
 
     Returns row dictionary (adjs), column dictionary (lexicon).
     '''
+    if corpus is None:
+        corpus = Corpus.from_df(df)
 
-    adjectives = set()
-    lexicon = set()
-
-    for index,row in df.iterrows():
-        targets = row["target_lemmas"]
-        tags = row["target_tags"]
-        lemmas = row["lemmas"]
-        if type(targets) != list:
-            targets = literal_eval(targets)
-        if type(tags) != list:
-            tags = literal_eval(tags)
-        if type(lemmas) != list:
-            lemmas = literal_eval(lemmas)
-        # get the adjective
-        ix = tags.index('ADJ')
-        adj = targets[ix]
-        adjectives.add(adj)
-        # get the sentence lemmas
-        for index,lemma in enumerate(lemmas):
-            lexicon.add(lemma)
-    
-    adjectives = list(adjectives)
-    lexicon = list(lexicon)
+    adjectives = pd.unique(pair_columns(df)["adj_lemma"]).tolist()
+    # lemma codes in order of first occurrence in the corpus
+    codes, first = np.unique(corpus.lemmas, return_index=True)
+    lexicon = corpus.lemma_vocab.decode(codes[np.argsort(first)]).tolist()
 
     adj_dict = build_dict(adjectives)
     lex_dict = build_dict(lexicon)
@@ -104,8 +97,9 @@ def fit_GMM(D, k=2, plot=True):
     assignment = gmm.predict(D)
 
     if plot:
-        minn = min(D)
-        maxx = max(D)
+        import matplotlib.pyplot as plt
+        minn = D.min()
+        maxx = D.max()
         step = (maxx-minn)/200
         bins = np.arange(minn, maxx, step)
         colors = ["cornflowerblue", "firebrick", "goldenrod", "gray"]
@@ -134,6 +128,7 @@ def pca_embed(A, k=256, show=True):
     embedded = pca.transform(A)
 
     if show:
+        import matplotlib.pyplot as plt
         plt.plot(pca.explained_variance_)
         plt.title("PCA explained variance")
         plt.xlabel("Number of embedding dimensions")
@@ -142,14 +137,69 @@ def pca_embed(A, k=256, show=True):
     return embedded
 
 
+def svd_embed(A, k=256, seed=0, show=True):
+    '''
+    Calculate embeddings of provided (dense or sparse) matrix with a
+    truncated, randomized SVD, which never densifies a sparse matrix.
+    Default is 256 dimensions, capped below the smaller matrix dimension.
+    seed makes the randomized SVD deterministic.
+    show option plots the explained variance to help inform dimension choice.
+
+    Returns embedded matrix.
+    '''
+    from sklearn.decomposition import TruncatedSVD
+    k = min(k, min(A.shape) - 1)
+    svd = TruncatedSVD(n_components=k, algorithm="randomized", random_state=seed)
+    embedded = svd.fit_transform(A)
+
+    if show:
+        import matplotlib.pyplot as plt
+        plt.plot(svd.explained_variance_)
+        plt.title("SVD explained variance")
+        plt.xlabel("Number of embedding dimensions")
+        plt.show()
+
+    return embedded
+
+
+def sparse_ppmi(A):
+    '''
+    Calculate positive pointwise mutual information (PPMI) for a sparse
+    matrix of counts. PPMI of a zero count is 0, so values are only
+    computed for the nonzero cells and the result stays sparse.
+
+    Returns CSR matrix with PPMI instead of counts.
+    '''
+    A = sparse.coo_matrix(A, dtype=float)
+    col_totals = np.asarray(A.sum(axis=0)).ravel()
+    row_totals = np.asarray(A.sum(axis=1)).ravel()
+    total = col_totals.sum()
+
+    # observed / expected, nonzero cells only
+    expected = row_totals[A.row] * col_totals[A.col] / total
+    with np.errstate(divide='ignore'):
+        values = np.log(A.data / expected)
+    values[values < 0] = 0.0
+
+    ppmi = sparse.csr_matrix((values, (A.row, A.col)), shape=A.shape)
+    ppmi.eliminate_zeros()
+
+    return ppmi
+
+
 def pmi(A, positive=True):
     '''
     Calculate pointwise mutual information (PMI) for a matrix of counts.
-    Default positive PMI.
+    Default positive PMI. Sparse count matrices stay sparse for PPMI
+    (see sparse_ppmi), and are converted to dense for PMI.
 
     Returns matrix with PMI instead of counts.
     '''
-    
+    if sparse.issparse(A):
+        if positive:
+            return sparse_ppmi(A)
+        A = A.toarray()
+
     A = A + np.nextafter(0, 1) # tiny smoothing ~=5e-324
     col_totals = A.sum(axis=0)
     total = col_totals.sum()
@@ -167,12 +217,69 @@ def pmi(A, positive=True):
     return A
 
 
-def populate_matrix(row_dict, column_dict, df, threshold=1):
+def cooccurrence_matrix(rows, cols, shape, weights=None):
+    '''
+    Build a sparse count matrix from vectorized index arrays, one (row, col)
+    pair per cooccurrence, counted weights times (default once).
+    Counts are accumulated in COO format (duplicate
+    cells are summed on conversion) and returned in CSR format.
+    '''
+    counts = np.ones(len(rows)) if weights is None else np.asarray(weights, dtype=float)
+    return sparse.coo_matrix((counts, (rows, cols)), shape=shape).tocsr()
+
+
+def cooccurrence_arrays(row_dict, column_dict, df, corpus=None):
+    '''
+    The co-occurrence data of df as flat arrays: the adjective row index
+    and the order (True if prenominal) of every sentence, the number of
+    lemmas of every sentence, and the lexicon column of every lemma
+    (read from the integer-coded corpus of df, see corpus.Corpus;
+    built from df if not given).
+    '''
+    if corpus is None:
+        corpus = Corpus.from_df(df)
+
+    pairs = pair_columns(df)
+    adj_ix = pairs["adj_lemma"].map(row_dict).values.astype(np.int64)
+    prenom = pairs["prenominal"].values == 1
+
+    # column of every lemma code of the corpus
+    lemma_columns = np.full(len(corpus.lemma_vocab), -1, dtype=np.int64)
+    lemma_columns[[corpus.lemma_vocab.get(lemma) for lemma in column_dict]] = list(column_dict.values())
+
+    return adj_ix, prenom, corpus.lengths, lemma_columns[corpus.lemmas]
+
+
+def count_matrices(adj_ix, prenom, lengths, cell_cols, shape, weights=None):
+    '''
+    Prenominal and postnominal co-occurrence matrices of the arrays of
+    cooccurrence_arrays(): one (adjective, lemma) cell for every lemma in the
+    sentence. weights is the number of times every sentence is counted
+    (default once), e.g., in a bootstrap sample.
+    '''
+    cell_rows = np.repeat(adj_ix, lengths)
+    cell_prenom = np.repeat(prenom, lengths)
+    cell_weights = np.repeat(weights, lengths) if weights is not None else np.ones(len(cell_cols))
+    # sentences counted 0 times have no cells
+    if weights is not None:
+        counted = cell_weights > 0
+        cell_rows, cell_cols, cell_prenom, cell_weights = cell_rows[counted], cell_cols[counted], cell_prenom[counted], cell_weights[counted]
+
+    prenom_matrix = cooccurrence_matrix(cell_rows[cell_prenom], cell_cols[cell_prenom], shape, cell_weights[cell_prenom])
+    postnom_matrix = cooccurrence_matrix(cell_rows[~cell_prenom], cell_cols[~cell_prenom], shape, cell_weights[~cell_prenom])
+
+    return prenom_matrix, postnom_matrix
+
+
+def populate_matrix(row_dict, column_dict, df, threshold=1, corpus=None):
     '''
     Creates two matrices: one for postnominal adjectives and one for prenominal
     adjectives. Rows correspond to adjective lemmas (types) and columns to
     all lemmas in the lexicon (types). Values are number of cooccurrences of an
     adjective with words in the lexicon at the sentence level.
+    Matrices are scipy.sparse CSR matrices, since almost all cells are zero.
+    Sentence lemmas are read from the integer-coded corpus of df
+    (see corpus.Corpus; built from df if not given).
 
     Keeps track of token frequencies of adjectives in each matrix. Calls
     remove_empty_rows() to filter both matrices by minimum instances of
@@ -181,49 +288,18 @@ def populate_matrix(row_dict, column_dict, df, threshold=1):
     Returns prenom_matrix and postnom_matrix, filtered based on 
     token frequency threshold, and containing cooccurrence-by-sentence counts.
     '''
+    shape = (len(row_dict.keys()),len(column_dict.keys()))
 
-    prenom_matrix = np.zeros((len(row_dict.keys()),len(column_dict.keys())))
-    postnom_matrix = np.zeros((len(row_dict.keys()),len(column_dict.keys())))
-
-    adj2count_prenom = defaultdict(int)
-    adj2count_postnom = defaultdict(int)
-
-    for index,row in df.iterrows():
-        targets = row["target_lemmas"]
-        tags = row["target_tags"]
-        lemmas = row["lemmas"]
-        if type(targets) != list:
-            targets = literal_eval(targets)
-        if type(tags) != list:
-            tags = literal_eval(tags)
-        if type(lemmas) != list:
-            lemmas = literal_eval(lemmas)
-
-        # get the adjective and its index
-        target_ix = tags.index('ADJ') # 0 if prenom, 1 if postnom
-        adj = targets[target_ix] # adj str
-        adj_ix = row_dict[adj] # adj index
-
-        # add to counter for later filtering
-        if target_ix == 0:
-            adj2count_prenom[adj] += 1
-        else:
-            adj2count_postnom[adj] += 1
-        
-        # loop over lemmas in the sentence to populate in matrix
-        for index,lemma in enumerate(lemmas):
-            lemma_ix = column_dict[lemma]
-            if target_ix == 0:
-                prenom_matrix[adj_ix,lemma_ix] += 1
-            else:
-                postnom_matrix[adj_ix,lemma_ix] += 1
-
-    # add indices that have zero counts in one order
-    for adj in row_dict.keys():
-        if adj not in adj2count_prenom.keys():
-            adj2count_prenom[adj] = 0
-        if adj not in adj2count_postnom.keys():
-            adj2count_postnom[adj] = 0
+    # get the adjective of every row and its index, and the lemmas
+    adj_ix, prenom, lengths, cell_cols = cooccurrence_arrays(row_dict, column_dict, df, corpus)
+
+    # token frequencies of adjectives in each order, for later filtering
+    prenom_counts = np.bincount(adj_ix[prenom], minlength=shape[0])
+    postnom_counts = np.bincount(adj_ix[~prenom], minlength=shape[0])
+    adj2count_prenom = {adj: prenom_counts[ix] for adj, ix in row_dict.items()}
+    adj2count_postnom = {adj: postnom_counts[ix] for adj, ix in row_dict.items()}
+
+    prenom_matrix, postnom_matrix = count_matrices(adj_ix, prenom, lengths, cell_cols, shape)
 
     # filtering
     updated_prenom_matrix, updated_postnom_matrix, updated_dict = remove_empty_rows(prenom_matrix, postnom_matrix, row_dict, adj2count_prenom, adj2count_postnom, threshold)
@@ -234,138 +310,201 @@ def populate_matrix(row_dict, column_dict, df, threshold=1):
 def remove_empty_rows(A, B, row_dict, Acount_dict, Bcount_dict, threshold=1):
     '''
     Remove every row_ix that occurs in less than {threshold} sentences
-    in matrix A from both matrices. Update row dictionary.
-
-    Repeat with matrix B.
+    in matrix A or in matrix B from both matrices. Update row dictionary.
+    Matrices can be dense arrays or scipy.sparse matrices.
 
     Returns filtered A and B, and updated dict.
     '''
 
     print(f"filtering matrices...\nthreshold is {threshold} minimum instance(s) in both\n")
 
-    ### MATRIX A ###
-    # separate bad and good rows based on threshold
-    Abad_rows = np.array([row_dict[adj] for adj in row_dict.keys() if Acount_dict[adj] < threshold])
-    Agood_rows = np.array([row_dict[adj] for adj in row_dict.keys() if Acount_dict[adj] >= threshold])
+    # separate bad and good rows based on threshold, in row index order
+    words = sorted(row_dict.keys(), key=lambda adj: row_dict[adj])
+    keep = np.array([(Acount_dict[adj] >= threshold) and (Bcount_dict[adj] >= threshold) for adj in words], dtype=bool)
+    good_rows = np.array([row_dict[adj] for adj in words], dtype=np.int64)[keep]
 
-    # remove bad row indices from dictionary
-    ix2word = {v:k for k,v in row_dict.items()}
-    Aupdated_dict = {}
-    new_ix = 0
-    for old_ix in range(len(ix2word.keys())):
-        if old_ix not in Abad_rows:
-            Aupdated_dict[ix2word[old_ix]] = new_ix
-            new_ix += 1
+    # renumber remaining rows in dictionary
+    updated_dict = {adj: new_ix for new_ix, adj in enumerate(np.array(words, dtype=object)[keep])}
 
     # good rows only in both matrices
-    new_A = A[Agood_rows,:]
-    new_B = B[Agood_rows,:]
+    final_A = A[good_rows,:]
+    final_B = B[good_rows,:]
 
-    ### MATRIX B ###
-    # separate bad and good rows based on threshold
-    Bbad_rows = np.array([Aupdated_dict[adj] for adj in Aupdated_dict.keys() if Bcount_dict[adj] < threshold])
-    Bgood_rows = np.array([Aupdated_dict[adj] for adj in Aupdated_dict.keys() if Bcount_dict[adj] >= threshold])
-    
-    # remove bad row indices from dictionary
-    ix2word = {v:k for k,v in Aupdated_dict.items()}
-    Bupdated_dict = {}
-    new_ix = 0
-    for old_ix in range(len(ix2word.keys())):
-        if old_ix not in Bbad_rows:
-            Bupdated_dict[ix2word[old_ix]] = new_ix
-            new_ix += 1
-    
-    # good rows only in both matrices
-    final_A = new_A[Bgood_rows,:]
-    final_B = new_B[Bgood_rows,:]
-
-    print(f"filtered matrices down to {len(Bupdated_dict.keys())} rows")
+    print(f"filtered matrices down to {len(updated_dict.keys())} rows")
 
-    return final_A, final_B, Bupdated_dict
+    return final_A, final_B, updated_dict
 
 
 def rowwise_cosine(A, B, plot=True):
     '''
     Calculate the cosine similarity between rows at the same indices
-    between two matrices.
+    between two (dense or sparse) matrices, for all rows at once.
+    Rows with zero norm in either matrix have a cosine similarity of 0.
 
     Returns a vector of length=rows. Each item is the cosine similarity of
     the corresponding rows in the two matrices.
 
     Plot creates a histogram of the data.
     '''
-    from scipy import spatial
-
-    sims = []
-
-    for row in range(A.shape[0]):
-        sim = 1 - spatial.distance.cosine(A[row], B[row])
-        sims.append(sim)
+    if sparse.issparse(A) or sparse.issparse(B):
+        A = sparse.csr_matrix(A)
+        B = sparse.csr_matrix(B)
+        dots = np.asarray(A.multiply(B).sum(axis=1)).ravel()
+        norms = np.sqrt(np.asarray(A.multiply(A).sum(axis=1)).ravel() * np.asarray(B.multiply(B).sum(axis=1)).ravel())
+    else:
+        dots = np.einsum('ij,ij->i', A, B)
+        norms = np.linalg.norm(A, axis=1) * np.linalg.norm(B, axis=1)
+
+    sims = np.zeros(len(dots))
+    np.divide(dots, norms, out=sims, where=norms > 0)
 
     if plot:
-        plt.hist(np.array(sims), density=False, bins=100)
+        import matplotlib.pyplot as plt
+        plt.hist(sims, density=False, bins=100)
         plt.ylabel('Items')
         plt.xlabel('Cosine Similarity')
         plt.show()
 
-    return np.array(sims)
+    return sims
+
+
+def bottom_k(values, k=10):
+    '''
+    Indices of the k smallest values, sorted by value (ascending).
+    Uses a partial sort, so only the k selected values are sorted.
+    '''
+    k = min(k, len(values))
+    if k == 0:
+        return np.array([], dtype=np.int64)
+    ix = np.argpartition(values, k-1)[:k]
+    return ix[np.argsort(values[ix])]
+
+
+def top_k(values, k=10):
+    '''
+    Indices of the k largest values, sorted by value (ascending).
+    Uses a partial sort, so only the k selected values are sorted.
+    '''
+    k = min(k, len(values))
+    if k == 0:
+        return np.array([], dtype=np.int64)
+    ix = np.argpartition(values, len(values)-k)[-k:]
+    return ix[np.argsort(values[ix])]
+
+
+def embed_cosines(prenom_matrix, postnom_matrix, k=128, seed=0, embedding="svd", show=False):
+    '''
+    PPMI of the stacked prenominal and postnominal count matrices,
+    embedding (svd or pca, k dimensions) and row-wise cosine similarity
+    between the prenominal and postnominal representations.
+
+    Returns the cosine similarity of every row, or None if either
+    matrix has no co-occurrences.
+    '''
+    if (prenom_matrix.sum() == 0) or (postnom_matrix.sum() == 0):
+        return None
+
+    # calculate PPMI from counts
+    both_matrices = sparse.vstack([prenom_matrix,postnom_matrix]).tocsr()
+    ppmi = pmi(both_matrices)
+
+    # get embeddings (truncated SVD of sparse PPMI, or PCA of dense PPMI)
+    if embedding == "pca":
+        embedded = pca_embed(ppmi.toarray(), k=k, show=show)
+    else:
+        embedded = svd_embed(ppmi, k=k, seed=seed, show=show)
+    height = prenom_matrix.shape[0]
+
+    # calculate row-wise cosine similarities
+    return rowwise_cosine(embedded[:height,:], embedded[height:,:], plot=show)
+
+
+def bow_cosines(df, threshold=2, k=128, seed=0, embedding="svd", show=False, corpus=None):
+    '''
+    Run the whole Bag-of-words analysis on a dataframe: co-occurrence
+    counts, PPMI, embedding (svd or pca, k dimensions) and row-wise cosine
+    similarity between the prenominal and postnominal representations.
+    Adjectives with fewer than threshold instances in either position
+    are left out. show option plots the intermediate results.
+    The sentence lemmas are integer-coded once (see corpus.Corpus), unless
+    the corpus of df is given.
+
+    Returns a dictionary adjective: cosine similarity, in row order.
+    If no co-occurrences remain, the dictionary is empty.
+    '''
+    if corpus is None:
+        corpus = Corpus.from_df(df)
+    adj_dict, lexicon_dict = build_matrix(df, corpus)
+
+    # populate matrices with cooccurrence counts,
+    # then filter for minimum token frequency of adjectives in each
+    prenom_matrix, postnom_matrix, adj_dict = populate_matrix(adj_dict, lexicon_dict, df, threshold=threshold, corpus=corpus)
+    cosine_sims = embed_cosines(prenom_matrix, postnom_matrix, k=k, seed=seed, embedding=embedding, show=show)
+    if cosine_sims is None:
+        return {}
+    height = len(cosine_sims)
+    ix_to_adj = {ix:adj for adj,ix in adj_dict.items()}
+
+    return {ix_to_adj[ix]: cosine_sims[ix] for ix in range(height)}
 
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("input_file",  
-    help="Give path of the directory with data. Must be .csv.")
+    help="Give path of the directory with data. Must be .parquet or .csv.")
+    parser.add_argument("--embedding", default="svd", choices=["svd", "pca"],
+    help="Embedding method: truncated SVD of sparse PPMI, or PCA of dense PPMI. (Default: svd)")
+    parser.add_argument("--k", type=int, default=128,
+    help="Number of embedding dimensions. (Default: 128)")
+    parser.add_argument("--seed", type=int, default=0,
+    help="Random seed of the randomized SVD and of the resampling. (Default: 0)")
+    parser.add_argument("--bootstrap", type=int, default=0,
+    help="Number of bootstrap samples of sentences, for confidence intervals of the cosine similarities. (Default: 0)")
+    parser.add_argument("--permutations", type=int, default=0,
+    help="Number of permutations of position labels, for p-values of the cosine similarities. (Default: 0)")
+    parser.add_argument("--alpha", type=float, default=0.05,
+    help="Confidence intervals are 1-alpha. (Default: 0.05)")
+    parser.add_argument("--workers", type=int, default=1,
+    help="Number of worker processes for --bootstrap and --permutations. (Default: 1)")
     args = parser.parse_args()
 
     # read in data from file as pandas df
-    df = pd.read_csv(args.input_file)
-
-    # build empty matricx with correct dimensions
-    print("building empty matrix...")
-    adj_dict, lexicon_dict = build_matrix(df)
-
-    # populate matrices with cooccurrence counts,
-    # then filter for minimum token frequency of adjectives in each (default=1)
-    print("populating matrices...\n")
-    prenom_matrix, postnom_matrix, adj_dict = populate_matrix(adj_dict, lexicon_dict, df, threshold=2)
-    if (np.sum(prenom_matrix) == 0) or (np.sum(postnom_matrix) == 0):
+    df = read_data(args.input_file)
+    corpus = Corpus.from_df(df)
+
+    # co-occurrence matrices, PPMI, embeddings and cosine similarities,
+    # filtered for minimum token frequency of adjectives in each position
+    print("building and populating matrices...\n")
+    cosines = bow_cosines(df, threshold=2, k=args.k, seed=args.seed, embedding=args.embedding, show=True, corpus=corpus)
+    if not cosines:
         print("One or both of your matrices are still empty!")
         sys.exit()
-    
-    # calculate PPMI from counts
-    both_matrices = np.concatenate([prenom_matrix,postnom_matrix], axis=0)
-    pmi = pmi(both_matrices)
-    
-    # get embeddings (PCA)
-    pmi = pca_embed(pmi, k=128)
-    height = prenom_matrix.shape[0]
-    prenom_matrix = pmi[:height,:]
-    postnom_matrix = pmi[height:,:]
 
-    # calculate row-wise cosine similarities
-    print("calculating cosine similarities...")
-    cosine_sims = rowwise_cosine(prenom_matrix, postnom_matrix)
+    adjectives = list(cosines.keys())
+    cosine_sims = np.array(list(cosines.values()))
 
     # print the bottom 10 least similar and top 10 most similar
-    most_similar_ix = np.argsort(cosine_sims)[-10:]
-    least_similar_ix = np.argsort(cosine_sims)[:10]
-    ix_to_adj = {k:v for v,k in adj_dict.items()}
+    most_similar_ix = top_k(cosine_sims, 10)
+    least_similar_ix = bottom_k(cosine_sims, 10)
     print("Least similar")
     for l in least_similar_ix:
-        print(ix_to_adj[l], cosine_sims[l])
+        print(adjectives[l], cosine_sims[l])
     print("\nMost similar")
     for l in most_similar_ix:
-        print(ix_to_adj[l], cosine_sims[l])
+        print(adjectives[l], cosine_sims[l])
 
     # fit Gaussian mixture model to check for two distributions
     fit_GMM(cosine_sims)
 
+    # confidence intervals and p-values from resampled sentences
+    if args.bootstrap or args.permutations:
+        from resample_bow import resample_cosines
+        table = resample_cosines(df, bootstrap=args.bootstrap, permutations=args.permutations, threshold=2,
+                                 k=args.k, seed=args.seed, embedding=args.embedding, alpha=args.alpha,
+                                 workers=args.workers, corpus=corpus)
+    else:
+        table = pd.DataFrame({"adjective": list(cosines.keys()), "cosine_similarity": list(cosines.values())})
+
     # write cosine sims to file
-    with open('cosines.csv', 'w') as f:
-        f.write('adjective,cosine_similarity\n')
-        for ix_key in ix_to_adj.keys():
-            adj = ix_to_adj[ix_key]
-            cosine = cosine_sims[ix_key]
-            f.write(f"{adj},{cosine}\n")
-    f.close()
\ No newline at end of file
+    table.to_csv('cosines.csv', index=False)
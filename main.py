@@ -1,126 +1,336 @@
 '''
-This script is designed in a cascading format. 
+This script is designed as a graph of stages, 
+ingest -> tag -> select -> pforms -> constraints (-> flexibility, -> effects).
 
 If only the Common Voice files are provided, 
 (1) sentences will be tagged for part-of-speech,
 (2) data will be subsetted for POS target sequences,
 (3) phonological forms will be added from the provided lexicon,
 and (4) constraints will be coded from provided regex file.
+With --flexibility, noun and adjective flexibility tables are written
+(see flexibility.py), and with --effects, random-effect columns are added
+to the output for the regression (see add_randomeffects.py).
 
 User can provide tagged data, then (2-4) will execute.
 User can provide target data, then (3-4) will execute.
 User can provide targets with pforms, then (4) will execute.
 
+Every stage output is a checkpoint, fingerprinted by its inputs and settings
+(see pipeline.py). On a rerun, stages whose inputs have not changed are skipped:
+e.g., after editing only constraints.tsv, command (0) only recodes constraints.
+--force reruns every stage.
+
+--profile writes a report of every stage's time, rows, memory and cache hits
+to profile_{lang}.json (see profiling.py).
+
+For a new Common Voice release, --previous reuses the outputs of an earlier
+run (its --outdir): only sentences whose audio file is new are tagged, selected
+and coded, then merged with the earlier outputs (see update.py), command (4).
+If the tagger, lexicon or constraint file changed since, the full pipeline is run.
+
+Every stage streams its input --chunksize rows at a time, so memory use does
+not grow with the size of the corpus (relative frequencies are set in a second
+pass over the coded output, from the pair counts of all rows).
+
+Intermediate datasets are written as .parquet by default (--format csv to
+change, --csv to also write .csv copies); output is always written as .csv too.
+
 Usage: 
 conda activate env
 (0) python main.py cv-corpus-7.0-2021-07-21-it --lexicon lexicon.csv --constraints constraints.tsv --lang it
-(1) python main.py cv-corpus-7.0-2021-07-21-it --tagged tagged.csv --lexicon lexicon.csv --constraints constraints.tsv --lang it
-(2) python main.py cv-corpus-7.0-2021-07-21-it --targets targets.csv --lexicon lexicon.csv --constraints constraints.tsv --lang it
-(3) python main.py cv-corpus-7.0-2021-07-21-it --dataset dataset.csv --constraints constraints.tsv --lang it
+(1) python main.py cv-corpus-7.0-2021-07-21-it --tagged tagged_it.parquet --lexicon lexicon.csv --constraints constraints.tsv --lang it
+(2) python main.py cv-corpus-7.0-2021-07-21-it --targets targets_it.parquet --lexicon lexicon.csv --constraints constraints.tsv --lang it
+(3) python main.py cv-corpus-7.0-2021-07-21-it --dataset dataset_it.parquet --constraints constraints.tsv --lang it
+(4) python main.py cv-corpus-8.0-2022-01-19-it --previous runs/it-7.0 --outdir runs/it-8.0 --lexicon lexicon.csv --constraints constraints.tsv --lang it
 '''
 
 import argparse
 import os
-import pandas as pd
-import pycountry
 import string
 import sys
-import wikipron
 
-from POS_tag import *
-from select_data import *
-from add_pforms import *
-from add_constraints import *
+from functools import lru_cache
+from pipeline import Stage, run_stages
+from profiling import PROFILERS
 
+# Stage modules (pandas, spaCy/Stanza, ...) are imported by the stages that
+# need them, so that --help and partial reruns start quickly.
+
+# file formats of the intermediate datasets, see data_io.py
+FORMATS = ["parquet", "csv"]
 
-'''
-Build dictionary of languages and their ISO-639-1 codes
-'''
-langs = {}
-for lang in pycountry.languages:
-    try:
-        langs[lang.alpha_2] = lang.name
-    except AttributeError:
-        langs[lang.alpha_3] = lang.name
+
+@lru_cache(maxsize=None)
+def iso_codes():
+    '''
+    Build dictionary of languages and their ISO-639-1 codes
+    (ISO-639-3 if there is none).
+    Built on first use only, since importing pycountry is slow.
+    '''
+    import pycountry
+    langs = {}
+    for lang in pycountry.languages:
+        try:
+            langs[lang.alpha_2] = lang.name
+        except AttributeError:
+            langs[lang.alpha_3] = lang.name
+    return langs
 
 
 def get_data(args):
     '''
     Takes the command line argument of the location of the corpus.
-    Calls make_df() on the validated corpus data.
+    Returns the path of the validated corpus data and its language.
     '''
     file_dir = vars(args)['my_files']
     # get language and corpus file
-    lang = [f for f in os.listdir(f'./{file_dir}/') if f in langs.keys()][0]
+    if args.lang and os.path.isdir(os.path.join(file_dir, args.lang)):
+        lang = args.lang
+    else:
+        lang = [f for f in os.listdir(f'./{file_dir}/') if f in iso_codes().keys()][0]
     filename =  f'./{file_dir}' + lang + '/validated.tsv'
-    # create a dataframe from corpus file
-    return make_df(filename), lang
+    return filename, lang
 
 
-def make_df(filename):
+# punctuation removed from sentences
+PUNCTUATION = string.punctuation + '—…„”“«»–'
+PUNCTUATION_TABLE = str.maketrans('', '', PUNCTUATION)
+CORPUS_COLUMNS = ['client_id','audio_file','sentence']
+
+
+def read_corpus(filename, chunksize=100000):
     '''
-    Takes a file name: validated.txt, likely.
-    Returns a dataframe of sentences, 
+    Takes a file name: validated.tsv, likely.
+    Streams the file and yields dataframes of (at most) chunksize sentences,
     with their corresponding client ID and audio file name.
+    Memory use does not grow with the size of the file.
     '''
-    corpus_file = open(filename,'r',encoding='utf8')
-    all_lines = corpus_file.readlines()
-    data = []
-    for i in range(1,len(all_lines)-1):
-        curr_line = all_lines[i].split('\t')
-        client_id = curr_line[0].strip()
-        audio_file = curr_line[1].strip()
-        puncts = string.punctuation + '—…„”“«»–'
-        sentence = curr_line[2].translate(str.maketrans('', '', puncts))
-        row = [client_id, audio_file, sentence]
-        data.append(row)
-    return pd.DataFrame(data,columns=['client_id','audio_file','sentence'])
+    import pandas as pd
+    with open(filename,'r',encoding='utf8') as corpus_file:
+        next(corpus_file, None) # header
+        data = []
+        for line in corpus_file:
+            # skip blank lines, e.g., at the end of the file
+            if not line.strip():
+                continue
+            curr_line = line.split('\t')
+            client_id = curr_line[0].strip()
+            audio_file = curr_line[1].strip()
+            sentence = curr_line[2].translate(PUNCTUATION_TABLE)
+            data.append([client_id, audio_file, sentence])
+            if len(data) == chunksize:
+                yield pd.DataFrame(data,columns=CORPUS_COLUMNS)
+                data = []
+        if data:
+            yield pd.DataFrame(data,columns=CORPUS_COLUMNS)
 
 
-def make_dataset(args, lang, targets=None, lexicon=None):
+def make_df(filename):
     '''
-    Adds phonological information from 
-    a provided lexicon to the targets file.
+    Takes a file name: validated.tsv, likely.
+    Returns a dataframe of sentences, 
+    with their corresponding client ID and audio file name.
     '''
-    ## Add phonological forms to data
-    print("Adding phonological information to dataset...")
-    if args.dataset == None:
-        updated_dataset = get_pforms(targets, lexicon, lang=lang)
-        updated_dataset.to_csv(path_or_buf=f"dataset_{lang}.csv", index=False)
+    import pandas as pd
+    chunks = list(read_corpus(filename))
+    if not chunks:
+        return pd.DataFrame(columns=CORPUS_COLUMNS)
+    return pd.concat(chunks, ignore_index=True)
 
-    ## Phonological information already present and loaded from --dataset argument
-    else:
-        updated_dataset = pd.read_csv(args.dataset) 
 
-    return updated_dataset 
+# POS sequences selected as targets
+SEQUENCES = [['NOUN','ADJ'], ['ADJ','NOUN']]
+# SEQUENCES = [['noun','adj'], ['adj','noun']]
+
+
+def make_tagged(corpus_path, out_path, args, lang):
+    '''
+    POS-tags a dataset of sentences.
+    Streams the corpus file through the tagger, args.chunksize sentences at a time,
+    and writes every tagged chunk to out_path.
+    Returns the number of sentences and the annotation cache hits, if any.
+    '''
+    from POS_tag import tag_chunks
+    from annotation_cache import AnnotationCache
+    from data_io import DataWriter
+    # Update dataframe chunks with POS tags and lemmas for each sentence
+    print("Tagging data for POS...")
+    cache = AnnotationCache(args.cache) if args.cache else None
+    writer = DataWriter(out_path, csv_copy=args.csv)
+    chunks = read_corpus(corpus_path, chunksize=args.chunksize)
+    for chunk in tag_chunks(chunks, lang, batch_size=args.batch_size, n_process=args.n_process, cache=cache):
+        writer.write(chunk)
+    writer.close()
+    metrics = {"sentences": writer.rows}
+    if cache is not None:
+        metrics.update({"cache_hits": cache.hits, "cache_misses": cache.misses, "cache_hit_rate": round(cache.hit_rate(), 4)})
+        cache.close()
+    return metrics
+
+
+def tag_config(lang):
+    '''
+    The tagger the tag stage would use (see POS_tag.installed_tagger()).
+    '''
+    from POS_tag import installed_tagger
+    return installed_tagger(lang)
 
 
-def make_targets(tagged, lang):
+def make_targets(tagged_path, out_path, args, lang):
     '''
     Subsets POS-tagged dataset for only the desired POS sequences.
+    The tagged dataset is streamed args.chunksize sentences at a time,
+    its lemmas and POS tags as integer-coded corpora (see corpus.py),
+    and the targets of every chunk are written to out_path.
     '''
+    from corpus import iter_corpus
+    from select_data import find_sequences
+    from data_io import DataWriter
     # Create dataset: sentences and strings that match POS sequences
     print("Subsetting data for target POS sequences...")
-    sequences = [['NOUN','ADJ'], ['ADJ','NOUN']]
-    # sequences = [['noun','adj'], ['adj','noun']]
-    targets = find_sequences(tagged, sequences, lang)
-    targets.to_csv(path_or_buf=f"targets_{lang}.csv", index=False)
+    writer = DataWriter(out_path, csv_copy=args.csv)
+    for chunk, corpus in iter_corpus(tagged_path, chunksize=args.chunksize):
+        writer.write(find_sequences(chunk, SEQUENCES, lang, corpus=corpus))
+    writer.close()
+
+
+def make_dataset(targets_path, out_path, args, lang):
+    '''
+    Adds phonological information from 
+    a provided lexicon to the targets file.
+    The targets are streamed args.chunksize rows at a time.
+    '''
+    from add_pforms import build_index, get_pforms
+    from data_io import DataWriter, iter_data
+    lexicon = check_lexicon(args)
+    index = build_index(lexicon)
+    ## Add phonological forms to data
+    print("Adding phonological information to dataset...")
+    writer = DataWriter(out_path, csv_copy=args.csv)
+    for chunk in iter_data(targets_path, chunksize=args.chunksize):
+        writer.write(get_pforms(chunk, index, lang=lang))
+    writer.close()
+
 
-    return targets
+def make_output(dataset_path, out_path, args, lang):
+    '''
+    Using dataset, which has target sequences with phonological forms,
+    generate constraint values for each line as defined in constraint file.
+    The output is always written as .csv too, for R.
+
+    Constraints are coded args.chunksize rows at a time, while the pair
+    counts of all rows are added up; relative_frequency, which needs
+    the counts of all rows, is then set in a second pass over the coded rows.
+    The pair counts are written next to the output (pair_counts_{lang}),
+    for incremental updates (see update.py) and later stages.
+    '''
+    from add_constraints import read_constraint_file, add_constraints_to_df, apply_pair_counts, combine_pair_counts, pair_counts
+    from data_io import DataWriter, iter_data, write_data
+    from features import FeatureStore
+    print("Coding data for phonological constraints...")
+    con = read_constraint_file(args.constraints)
+    # word features, computed once per word across chunks
+    store = FeatureStore()
+
+    # (1) code constraints chunk by chunk, counting pairs
+    root, ext = os.path.splitext(out_path)
+    coded_path = root + ".coded" + ext
+    writer = DataWriter(coded_path)
+    counts = []
+    for chunk in iter_data(dataset_path, chunksize=args.chunksize):
+        chunk = add_constraints_to_df(chunk, con, args.lang, frequencies=False, store=store)
+        counts = [combine_pair_counts(*counts, pair_counts(chunk))]
+        writer.write(chunk)
+    writer.close()
+    if not counts:
+        import pandas as pd
+        counts = [pd.DataFrame(columns=["adj_lemma", "noun_lemma", "prenominal", "postnominal"])]
+    counts = counts[0]
+
+    # (2) relative frequencies from the pair counts of all rows
+    writer = DataWriter(out_path, csv_copy=True)
+    for chunk in iter_data(coded_path, chunksize=args.chunksize):
+        writer.write(apply_pair_counts(chunk, counts))
+    writer.close()
+    os.remove(coded_path)
+
+    write_data(counts, os.path.join(os.path.dirname(out_path), f"pair_counts_{lang}.{args.format}"))
+
+
+def read_output_counts(output_path, args, lang):
+    '''
+    The pair counts of all rows of the output, written by the constraints
+    stage next to it, or counted from the output if there are none.
+    '''
+    from add_constraints import combine_pair_counts, pair_counts
+    from data_io import iter_data, read_data
+    counts_path = os.path.join(os.path.dirname(output_path), f"pair_counts_{lang}.{args.format}")
+    if os.path.exists(counts_path):
+        return read_data(counts_path)
+    return combine_pair_counts(*(pair_counts(chunk) for chunk in iter_data(output_path, chunksize=args.chunksize)))
 
 
-def make_tagged(args):
+def make_flexibility(output_path, out_path, args, lang):
     '''
-    POS-tags a dataset of sentences.
+    Writes the noun and adjective flexibility tables of the output, from the
+    pair counts of all rows, and the rows with flexible adjectives
+    (see flexibility.py). The output is streamed args.chunksize rows at a time.
+    The rows are written as .csv too, for R.
     '''
-    # Return a dataframe with client ID number, audio file name, and sentence
-    data, lang = get_data(args)
-    # Update dataframe with POS tags and lemmas for each sentence
-    print("Tagging data for POS...")
-    data = tag_df(data, lang)
-    data.to_csv(path_or_buf=f"tagged_{lang}.csv", index=False)
+    from flexibility import flex_tables, flex_filter, write_flex_tables
+    from data_io import DataWriter, iter_data
+    print("Tabulating flexibility...")
+    nouns, adjs = flex_tables(read_output_counts(output_path, args, lang))
+    write_flex_tables(nouns, adjs, lang, outdir=os.path.dirname(out_path))
+    writer = DataWriter(out_path, csv_copy=True)
+    for chunk in iter_data(output_path, chunksize=args.chunksize):
+        writer.write(flex_filter(chunk, adjs))
+    writer.close()
+
+
+def make_effects(output_path, out_path, args, lang):
+    '''
+    Adds random-effect columns (NOUN, ADJECTIVE, FIXED and, if args.codes,
+    integer codes for R) to the output, see add_randomeffects.py.
+    The output is streamed args.chunksize rows at a time; the codes come from
+    the pair counts of all rows written by the constraints stage.
+    Written as .csv too, for R.
+    '''
+    from add_randomeffects import add_randomeffects, effect_codes
+    from data_io import DataWriter, iter_data
+    print("Adding random effects...")
+    codes = None
+    if args.codes:
+        codes = effect_codes(read_output_counts(output_path, args, lang))
+    writer = DataWriter(out_path, csv_copy=True)
+    for chunk in iter_data(output_path, chunksize=args.chunksize):
+        writer.write(add_randomeffects(chunk, codes))
+    writer.close()
 
-    return data, lang
+
+'''
+Stage graph: ingest -> tag -> select -> pforms -> constraints (-> flexibility, -> effects).
+ingest is the corpus file itself (validated.tsv).
+flexibility and effects are optional (--flexibility, --effects).
+'''
+STAGES = [
+    Stage("ingest", "validated", None),
+    Stage("tag", "tagged", make_tagged, upstream="ingest",
+          config=lambda args, lang: {"lang": lang, "tagger": tag_config(lang)}),
+    Stage("select", "targets", make_targets, upstream="tag",
+          config=lambda args, lang: {"lang": lang, "sequences": SEQUENCES}),
+    Stage("pforms", "dataset", make_dataset, upstream="select",
+          files=lambda args: [args.lexicon] if args.lexicon else [],
+          config=lambda args, lang: {"lang": lang}),
+    Stage("constraints", "output", make_output, upstream="pforms",
+          files=lambda args: [args.constraints] if args.constraints else [],
+          config=lambda args, lang: {"lang": args.lang}),
+    Stage("flexibility", "filtered", make_flexibility, upstream="constraints",
+          enabled=lambda args: args.flexibility),
+    Stage("effects", "effects", make_effects, upstream="constraints",
+          config=lambda args, lang: {"codes": args.codes},
+          enabled=lambda args: args.effects),
+]
 
 
 def check_lexicon(args):
@@ -129,6 +339,7 @@ def check_lexicon(args):
     is in the correct format (.csv or .tsv).
     Also verifies that it contains the columns 'word' and 'phonological_form'.
     '''
+    import pandas as pd
     print("Reading in the lexicon...")
     if args.lexicon == None:
         print("No lexicon specified, please provide a lexicon if you want to do phonological analysis.")
@@ -153,79 +364,124 @@ def check_lexicon(args):
 
         return lexicon
 
-'''
-Parse command line arguments:
-my_files = directory of Common Voice corpus files, 
-e.g., cv-corpus-7.0-2021-07-21-it
-'''
-parser = argparse.ArgumentParser()
-parser.add_argument("my_files",  
-help="Give the path of the directory with corpus files. Default from Common Voice looks like: cv-corpus-7.0-YYYY-MM-DD-ISOlanguagecode")
-parser.add_argument('--lang', default=None,
-                    help='Provide two-char ISO-639-1 code of language. Helpful if you wish to implement language-specific amendments.')
-parser.add_argument('--tagged', default=None,
-                    help='Provide tagged dataset if already done and you are ready to subset, .csv. (Default: None)')
-parser.add_argument('--targets', default=None,
-                    help='Provide subset of tagged dataset with target sequences if already done and you are ready to get phonological forms, .csv. (Default: None)')
-parser.add_argument('--lexicon', default=None,
-                    help='Provide lexicon of orthographic-phonological forms, .tsv or .csv. See README for more info. (Default: None)')
-parser.add_argument('--dataset', default=None,
-                    help='Provide target data with phonological info if already done and you are ready to determine constraint values, .csv. (Default: None)')
-parser.add_argument('--constraints', default=None,
-                    help='Provide .txt file of regular expressions used to form constraints. See README for more info. (Default: None)')
-
-args = parser.parse_args()
-
-## global variable lang (ISO code for language)
-if args.lang:
-    lang = args.lang
-else:
-    lang = 'user'
-
-
-if args.dataset:
+def build_parser():
     '''
-    If dataset is provided (POS target sequences with phonological forms),
-    read in the file.
+    Parse command line arguments:
+    my_files = directory of Common Voice corpus files, 
+    e.g., cv-corpus-7.0-2021-07-21-it
     '''
-    dataset = pd.read_csv(args.dataset)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("my_files",  
+    help="Give the path of the directory with corpus files. Default from Common Voice looks like: cv-corpus-7.0-YYYY-MM-DD-ISOlanguagecode")
+    parser.add_argument('--lang', default=None,
+                        help='Provide two-char ISO-639-1 code of language. Helpful if you wish to implement language-specific amendments.')
+    parser.add_argument('--chunksize', type=int, default=100000,
+                        help='Number of rows read and processed at a time by every stage; bounds memory use. (Default: 100000)')
+    parser.add_argument('--batch_size', type=int, default=1000,
+                        help='Number of sentences passed to the tagger per batch. (Default: 1000)')
+    parser.add_argument('--n_process', type=int, default=1,
+                        help='Number of processes used by the spaCy tagger. (Default: 1)')
+    parser.add_argument('--cache', default=None,
+                        help='Path of an annotation cache file, reused across runs so that previously tagged sentences are not tagged again. (Default: None)')
+    parser.add_argument('--tagged', default=None,
+                        help='Provide tagged dataset if already done and you are ready to subset, .parquet or .csv. (Default: None)')
+    parser.add_argument('--targets', default=None,
+                        help='Provide subset of tagged dataset with target sequences if already done and you are ready to get phonological forms, .parquet or .csv. (Default: None)')
+    parser.add_argument('--lexicon', default=None,
+                        help='Provide lexicon of orthographic-phonological forms, .tsv or .csv. See README for more info. (Default: None)')
+    parser.add_argument('--dataset', default=None,
+                        help='Provide target data with phonological info if already done and you are ready to determine constraint values, .parquet or .csv. (Default: None)')
+    parser.add_argument('--constraints', default=None,
+                        help='Provide .txt file of regular expressions used to form constraints. See README for more info. (Default: None)')
+    parser.add_argument('--flexibility', action='store_true',
+                        help='Also write noun and adjective flexibility tables (nouns_{lang}.csv, adjs_{lang}.csv) and the output rows with flexible adjectives (filtered_{lang}), see flexibility.py.')
+    parser.add_argument('--effects', action='store_true',
+                        help='Also write the output with random-effect columns NOUN, ADJECTIVE and FIXED (effects_{lang}), see add_randomeffects.py.')
+    parser.add_argument('--codes', action='store_true',
+                        help='With --effects, also add integer lemma IDs and pair frequency bands for R.')
+    parser.add_argument('--format', default='parquet', choices=FORMATS,
+                        help='File format of the intermediate datasets and output. Parquet keeps list columns typed. (Default: parquet)')
+    parser.add_argument('--csv', action='store_true',
+                        help='Also write a .csv copy of every intermediate dataset. The output is always written as .csv for R.')
+    parser.add_argument('--outdir', default='.',
+                        help='Directory of the intermediate datasets, output and checkpoint manifest. (Default: current directory)')
+    parser.add_argument('--force', action='store_true',
+                        help='Rerun every stage, even if its checkpoint is up to date.')
+    parser.add_argument('--profile', nargs='?', const='report', default=None, choices=PROFILERS,
+                        help='Measure every stage (time, rows, memory, cache hits) and write a report, profile_{lang}.json, next to the output. With cprofile or pyinstrument, also write a profile of every stage. (Default: None)')
+    parser.add_argument('--previous', default=None,
+                        help='Output directory of a run on an earlier release of the corpus. Only new sentences are processed and merged with its outputs. (Default: None)')
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    ## global variable lang (ISO code for language)
+    if args.lang:
+        lang = args.lang
+    else:
+        lang = 'user'
+
+    if args.dataset:
+        '''
+        If dataset is provided (POS target sequences with phonological forms),
+        only code constraints.
+        '''
+        source = ("pforms", args.dataset)
+    elif args.targets:
+        '''
+        If POS target sequences file is provided,
+        add phonological forms from lexicon.
+        '''
+        source = ("select", args.targets)
+    elif args.tagged:
+        '''
+        If POS-tagged sentence file is provided,
+        subset it for target POS sequences,
+        add phonological forms from lexicon.
+        '''
+        source = ("tag", args.tagged)
+    else:
+        '''
+        If Common Voice folder is provided,
+        tag it for part-of-speech,
+        subset it for target POS sequences,
+        add phonological forms from lexicon.
+        '''
+        corpus_path, lang = get_data(args)
+        source = ("ingest", corpus_path)
+
+    os.makedirs(args.outdir, exist_ok=True)
+    profiler = None
+    if args.profile:
+        from profiling import Profiler
+        try:
+            profiler = Profiler(args.outdir, lang, profiler=args.profile)
+        except ImportError:
+            print("pyinstrument is not installed (pip install pyinstrument), use --profile cprofile instead.")
+            sys.exit()
 
-elif args.targets:
-    '''
-    If POS target sequences file is provided,
-    add phonological forms from lexicon.
-    '''
-    lexicon = check_lexicon(args)
-    dataset = make_dataset(args, targets=pd.read_csv(args.targets), lexicon=lexicon, lang=lang)
+    if args.previous and source[0] == "ingest":
+        '''
+        If a previous run is provided,
+        run the stages on the new sentences only and merge.
+        '''
+        from update import run_update
+        try:
+            paths = run_update(args, STAGES, run_stages, source[1], lang, profiler=profiler)
+        except FileNotFoundError as error:
+            print(error)
+            sys.exit()
+    else:
+        paths = run_stages(STAGES, source, args, lang, outdir=args.outdir, force=args.force, profiler=profiler)
+    if profiler is not None:
+        profiler.write(args)
+    print("All done!")
 
-elif args.tagged:
-    '''
-    If POS-tagged sentence file is provided,
-    subset it for target POS sequences,
-    add phonological forms from lexicon.
-    '''
-    targets = make_targets(pd.read_csv(args.tagged),lang)
-    lexicon = check_lexicon(args)
-    dataset = make_dataset(args, targets=targets, lexicon=lexicon, lang=lang)
+    return paths
 
-else:
-    '''
-    If Common Voice folder is provided,
-    tag it for part-of-speech,
-    subset it for target POS sequences,
-    add phonological forms from lexicon.
-    '''
-    tagged, lang = make_tagged(args)
-    targets = make_targets(tagged, lang=lang)
-    lexicon = check_lexicon(args)
-    dataset = make_dataset(args, targets=targets, lexicon=lexicon, lang=lang)
 
-'''
-Using dataset, which has target sequences with phonological forms,
-generate constraint values for each line as defined in constraint file.
-''' 
-print("Coding data for phonological constraints...")
-con = read_constraint_file(args.constraints)
-constraints = add_constraints_to_df(dataset, con, args.lang)
-constraints.to_csv(path_or_buf=f"output_{lang}.csv", index=False)
-print("All done!")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
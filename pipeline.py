@@ -0,0 +1,202 @@
+'''
+Stage graph of the pipeline, with fingerprinted checkpoints.
+
+Every stage reads the output file of its upstream stage and writes its own
+output file (its checkpoint). A stage's fingerprint is a hash of
+- its settings fingerprint, a hash of
+  - the stage name and version,
+  - its configuration (e.g., language, target sequences),
+  - the content of its extra input files (e.g., lexicon, constraints),
+- the fingerprint of its upstream stage.
+Fingerprints of completed stages are kept in a manifest next to the outputs
+(checkpoints_{lang}.json), with their settings fingerprints. On a rerun,
+every stage whose fingerprint and output file are unchanged is skipped, so,
+e.g., editing only the constraint file recomputes only the constraint stage.
+
+A source stage has no computation: its output is an existing file
+(the corpus, or a dataset given on the command line), fingerprinted by content.
+'''
+
+import hashlib
+import json
+import os
+
+
+class Stage:
+    '''
+    One stage of the pipeline graph.
+
+    name: stage name, also the key of its manifest entry
+    output: stem of its output file, {output}_{lang}.{format}
+    run: function(in_path, out_path, args, lang) computing the stage, file to file;
+         it may return a dictionary of metrics (see profiling.py)
+    upstream: name of the stage whose output it reads (None for the first stage)
+    files: function(args) returning the paths of extra input files
+    config: function(args, lang) returning the settings that change its output
+    version: to be increased when a code change changes the stage's output
+    enabled: function(args) returning False if the stage is not to be run
+             (for optional stages no other stage depends on)
+    '''
+
+    def __init__(self, name, output, run, upstream=None, files=None, config=None, version=1, enabled=None):
+        self.name = name
+        self.output = output
+        self.run = run
+        self.upstream = upstream
+        self.files = files or (lambda args: [])
+        self.config = config or (lambda args, lang: {})
+        self.version = version
+        self.enabled = enabled or (lambda args: True)
+
+
+def file_hash(path, known_hashes):
+    '''
+    SHA-256 of the content of a file.
+    known_hashes maps paths to [size, mtime, hash] of files hashed by earlier
+    runs; a file with the same size and modification time is not read again.
+    '''
+    stat = os.stat(path)
+    known = known_hashes.get(path)
+    if known and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+        return known[2]
+
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    known_hashes[path] = [stat.st_size, stat.st_mtime_ns, sha.hexdigest()]
+
+    return sha.hexdigest()
+
+
+def load_manifest(path):
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf8') as f:
+            return json.load(f)
+    return {"stages": {}, "file_hashes": {}}
+
+
+def save_manifest(manifest, path):
+    with open(path, 'w', encoding='utf8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+
+def settings_fingerprint(stage, args, lang, known_hashes):
+    '''
+    Fingerprint of a stage without its upstream: name, version, configuration
+    and extra input files. Two runs with the same settings fingerprint compute
+    the same output from the same input (see update.py).
+    '''
+    parts = {
+        "stage": stage.name,
+        "version": stage.version,
+        "config": stage.config(args, lang),
+        "files": {path: file_hash(path, known_hashes) for path in stage.files(args)},
+    }
+    content = json.dumps(parts, sort_keys=True, default=str)
+
+    return hashlib.sha256(content.encode('utf8')).hexdigest()
+
+
+def changed_settings(stages, names, args, lang, directory):
+    '''
+    Names of the stages (of names) whose settings fingerprint differs from
+    the one recorded by the run in directory, or was not recorded.
+    '''
+    manifest = load_manifest(os.path.join(directory, f"checkpoints_{lang}.json"))
+    known_hashes = manifest.get("file_hashes", {})
+    done = manifest.get("stages", {})
+    changed = []
+    for stage in stages:
+        if stage.name not in names:
+            continue
+        entry = done.get(stage.name, {})
+        if entry.get("settings") != settings_fingerprint(stage, args, lang, known_hashes):
+            changed.append(stage.name)
+
+    return changed
+
+
+def record_settings(stages, names, args, lang, outdir, paths):
+    '''
+    Records the settings fingerprints of the stages (of names) in the
+    manifest of outdir, for outputs not written by run_stages()
+    (see update.py); paths are their outputs. Their checkpoints are
+    not up to date for run_stages(), which reruns them if asked to.
+    '''
+    manifest_path = os.path.join(outdir, f"checkpoints_{lang}.json")
+    manifest = load_manifest(manifest_path)
+    known_hashes = manifest.setdefault("file_hashes", {})
+    done = manifest.setdefault("stages", {})
+    for stage in stages:
+        if stage.name in names:
+            done[stage.name] = {"fingerprint": None, "path": paths.get(stage.name),
+                                "settings": settings_fingerprint(stage, args, lang, known_hashes)}
+    save_manifest(manifest, manifest_path)
+
+
+def fingerprint(settings, upstream_fingerprint):
+    '''
+    Fingerprint of a (non-source) stage, see module docstring: of its
+    settings fingerprint (see settings_fingerprint()) and the fingerprint
+    of its upstream stage.
+    '''
+    content = json.dumps({"settings": settings, "upstream": upstream_fingerprint}, sort_keys=True)
+
+    return hashlib.sha256(content.encode('utf8')).hexdigest()
+
+
+def run_stages(stages, source, args, lang, outdir=".", force=False, profiler=None):
+    '''
+    Run the stages, in order, that follow the source stage.
+    source = (stage name, path of the file standing in for its output).
+    Stages whose checkpoint is up to date are skipped (unless force).
+    If a profiling.Profiler is given, every stage is measured by it.
+
+    Returns a dictionary of the output path of every stage.
+    '''
+    manifest_path = os.path.join(outdir, f"checkpoints_{lang}.json")
+    manifest = load_manifest(manifest_path)
+    known_hashes = manifest.setdefault("file_hashes", {})
+    done = manifest.setdefault("stages", {})
+
+    source_name, source_path = source
+    names = [stage.name for stage in stages]
+    paths = {source_name: source_path}
+    fingerprints = {source_name: file_hash(source_path, known_hashes)}
+
+    for stage in stages[names.index(source_name)+1:]:
+        if not stage.enabled(args):
+            continue
+        out_path = os.path.join(outdir, f"{stage.output}_{lang}.{args.format}")
+        settings = settings_fingerprint(stage, args, lang, known_hashes)
+        stage_fingerprint = fingerprint(settings, fingerprints[stage.upstream])
+        paths[stage.name] = out_path
+        fingerprints[stage.name] = stage_fingerprint
+
+        entry = done.get(stage.name)
+        if (not force and entry is not None and entry["fingerprint"] == stage_fingerprint
+                and entry["path"] == out_path and os.path.exists(out_path)):
+            print(f"Stage '{stage.name}' is up to date ({out_path}), skipping.")
+            entry["settings"] = settings
+            if profiler is not None:
+                profiler.skip(stage.name, out_path)
+            continue
+
+        # outputs are written in place: until the stage is done, its checkpoint
+        # is removed, so an interrupted run does not leave a partial output
+        # that looks up to date
+        if done.pop(stage.name, None) is not None:
+            save_manifest(manifest, manifest_path)
+        if profiler is not None:
+            profiler.run(stage, paths[stage.upstream], out_path, args, lang)
+        else:
+            stage.run(paths[stage.upstream], out_path, args, lang)
+
+        # record the checkpoint right away, so an interrupted run can resume
+        done[stage.name] = {"fingerprint": stage_fingerprint, "path": out_path, "settings": settings}
+        save_manifest(manifest, manifest_path)
+
+    save_manifest(manifest, manifest_path)
+
+    return paths
@@ -0,0 +1,188 @@
+'''
+Per-stage instrumentation of a pipeline run (main.py --profile).
+
+For every stage run by pipeline.run_stages(), the Profiler records
+- wall time and CPU time (of the process and of its worker processes),
+- rows in (upstream output) and rows out (stage output), and throughput,
+- peak resident memory (RSS) while the stage ran,
+- the metrics returned by the stage itself (e.g., annotation cache hits).
+Stages skipped as up to date are recorded as skipped.
+
+The report is written as .json next to the output, profile_{lang}.json.
+Optionally, every stage is also profiled with cProfile (profile_{lang}_{stage}.prof,
+to read with pstats or snakeviz) or pyinstrument (profile_{lang}_{stage}.html,
+pip install pyinstrument).
+'''
+
+import json
+import os
+import sys
+import time
+
+from datetime import datetime, timezone
+
+# profilers of --profile, besides the report itself
+PROFILERS = ["report", "cprofile", "pyinstrument"]
+
+
+def reset_peak_rss():
+    '''
+    Resets the peak resident memory of the process, so that the next
+    peak_rss_mb() is the peak since now. Only possible on Linux;
+    returns False if the peak could not be reset.
+    '''
+    try:
+        with open("/proc/self/clear_refs", 'w') as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    '''
+    Peak resident memory of the process in MB (since the last reset_peak_rss()
+    on Linux, since the process started elsewhere). None if unknown.
+    '''
+    try:
+        with open("/proc/self/status", 'r') as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes, except on macOS (bytes)
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+def children_cpu_time():
+    '''
+    CPU time (user + system) of the terminated worker processes of this process.
+    '''
+    times = os.times()
+    return times.children_user + times.children_system
+
+
+def count_file_rows(path):
+    '''
+    Number of rows of a stage input or output: lines (without the header and
+    blank lines) of a .tsv corpus, rows of a dataset file (see data_io.count_rows()).
+    None if there is no such file.
+    '''
+    if path is None or not os.path.exists(path):
+        return None
+    if path.endswith(".tsv"):
+        with open(path, 'r', encoding='utf8') as f:
+            next(f, None) # header
+            return sum(1 for line in f if line.strip())
+    from data_io import count_rows
+    return count_rows(path)
+
+
+class Profiler:
+    '''
+    Collects the measurements of every stage of a run (see module docstring).
+    outdir and lang locate the report; profiler is one of PROFILERS.
+    '''
+
+    def __init__(self, outdir, lang, profiler="report"):
+        self.outdir = outdir
+        self.lang = lang
+        self.profiler = profiler
+        self.stages = []
+        self.started = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        self.start = time.perf_counter()
+        if profiler == "pyinstrument":
+            import pyinstrument # fail early if it is not installed
+
+    def dump_path(self, stage_name):
+        ext = "prof" if self.profiler == "cprofile" else "html"
+        return os.path.join(self.outdir, f"profile_{self.lang}_{stage_name}.{ext}")
+
+    def skip(self, stage_name, out_path):
+        self.stages.append({"stage": stage_name, "skipped": True, "output": out_path})
+
+    def run(self, stage, in_path, out_path, args, lang):
+        '''
+        Runs a stage as run_stages() would, measuring it.
+        Returns what the stage returns.
+        '''
+        record = {"stage": stage.name, "skipped": False, "input": in_path, "output": out_path}
+        record["rows_in"] = count_file_rows(in_path)
+
+        if self.profiler == "cprofile":
+            import cProfile
+            profile = cProfile.Profile()
+        elif self.profiler == "pyinstrument":
+            import pyinstrument
+            profile = pyinstrument.Profiler()
+
+        rss_reset = reset_peak_rss()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        children_start = children_cpu_time()
+        if self.profiler == "cprofile":
+            profile.enable()
+        elif self.profiler == "pyinstrument":
+            profile.start()
+        try:
+            metrics = stage.run(in_path, out_path, args, lang)
+        finally:
+            if self.profiler == "cprofile":
+                profile.disable()
+            elif self.profiler == "pyinstrument":
+                profile.stop()
+        record["wall_s"] = round(time.perf_counter() - wall_start, 4)
+        record["cpu_s"] = round(time.process_time() - cpu_start, 4)
+        record["children_cpu_s"] = round(children_cpu_time() - children_start, 4)
+        peak = peak_rss_mb()
+        record["peak_rss_mb"] = round(peak, 1) if peak is not None else None
+        record["peak_rss_scope"] = "stage" if rss_reset else "process"
+
+        record["rows_out"] = count_file_rows(out_path)
+        if record["rows_in"] is not None and record["wall_s"] > 0:
+            record["rows_per_s"] = round(record["rows_in"] / record["wall_s"], 1)
+        if metrics:
+            record["metrics"] = metrics
+
+        if self.profiler == "cprofile":
+            record["profile"] = self.dump_path(stage.name)
+            profile.dump_stats(record["profile"])
+        elif self.profiler == "pyinstrument":
+            record["profile"] = self.dump_path(stage.name)
+            with open(record["profile"], 'w', encoding='utf8') as f:
+                f.write(profile.output_html())
+
+        print(f"[profile] {stage.name}: {record['wall_s']:.2f}s wall, {record['cpu_s']:.2f}s CPU, "
+              f"{record['rows_in']} -> {record['rows_out']} rows, peak RSS {record['peak_rss_mb'] or 0:.0f} MB")
+        self.stages.append(record)
+
+        return metrics
+
+    def report(self, args=None):
+        '''
+        The report of the run, as a dictionary.
+        '''
+        return {
+            "lang": self.lang,
+            "started": self.started,
+            "wall_s": round(time.perf_counter() - self.start, 4),
+            "profiler": self.profiler,
+            "args": vars(args) if args is not None else None,
+            "stages": self.stages,
+        }
+
+    def write(self, args=None):
+        '''
+        Writes the report to {outdir}/profile_{lang}.json. Returns its path.
+        '''
+        path = os.path.join(self.outdir, f"profile_{self.lang}.json")
+        with open(path, 'w', encoding='utf8') as f:
+            json.dump(self.report(args), f, indent=2, default=str)
+        print(f"Profile report written to {path}")
+        return path
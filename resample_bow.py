@@ -0,0 +1,209 @@
+'''
+Bootstrap and permutation resampling of the Bag-of-words cosine similarities
+of generate_bow.py (python generate_bow.py dataset.parquet --bootstrap 1000).
+
+Every replicate reruns co-occurrence counting, PPMI, embedding and row-wise
+cosine similarity on resampled sentences:
+- bootstrap: sentences (rows of the dataset) are drawn with replacement;
+  a sentence drawn n times is counted n times, so samples are never built.
+  Percentiles of the replicates give a confidence interval per adjective.
+- permutation: the position labels (prenominal/postnominal) are shuffled
+  among the sentences of every adjective, keeping its token frequency in
+  each position. The p-value of an adjective is the share of replicates
+  with a cosine similarity at most as high as the observed one: a low
+  p-value means its prenominal and postnominal contexts differ more than
+  by chance.
+Adjectives with fewer than threshold instances in either position of a
+replicate are left out of that replicate (NaN).
+
+Replicates run in parallel worker processes. The co-occurrence arrays are
+written once as .npy files and memory-mapped read-only by every worker.
+Every replicate has its own random generator, seeded by (seed, kind,
+replicate number), so results do not depend on the number of workers.
+'''
+
+import multiprocessing
+import numpy as np
+import os
+import pandas as pd
+import tempfile
+import warnings
+
+from corpus import Corpus
+from generate_bow import build_matrix, cooccurrence_arrays, count_matrices, embed_cosines
+
+# replicate kinds, numbered for the seeds of their random generators
+KINDS = ["observed", "bootstrap", "permutation"]
+ARRAYS = ["adj_ix", "prenom", "lengths", "cell_cols"]
+
+# co-occurrence arrays and settings of a worker process, see load_shared()
+_SHARED = {}
+
+
+def write_shared(directory, adj_ix, prenom, lengths, cell_cols):
+    '''
+    Writes the co-occurrence arrays (see generate_bow.cooccurrence_arrays())
+    to {directory}/{name}.npy, to be memory-mapped by the workers.
+    '''
+    arrays = {"adj_ix": adj_ix, "prenom": prenom, "lengths": lengths, "cell_cols": cell_cols}
+    for name in ARRAYS:
+        np.save(os.path.join(directory, f"{name}.npy"), arrays[name])
+
+
+def load_shared(directory, settings):
+    '''
+    Memory-maps the co-occurrence arrays of write_shared() read-only, and
+    keeps them with the settings of the run (shape, threshold, k, seed, embedding)
+    for replicate(). Initializer of the worker processes.
+    '''
+    for name in ARRAYS:
+        _SHARED[name] = np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r')
+    _SHARED.update(settings)
+    # one BLAS thread per worker process, the workers already use every core
+    if multiprocessing.parent_process() is not None:
+        try:
+            from threadpoolctl import threadpool_limits
+            _SHARED["threadpool_limits"] = threadpool_limits(1)
+        except ImportError:
+            pass
+
+
+def shuffle_within(labels, groups, rng):
+    '''
+    Permutes labels among the rows of the same group.
+    '''
+    by_group = np.argsort(groups, kind='stable')
+    shuffled = np.lexsort((rng.random(len(groups)), groups))
+    permuted = np.empty_like(labels)
+    permuted[shuffled] = labels[by_group]
+
+    return permuted
+
+
+def replicate(task):
+    '''
+    Cosine similarity of every adjective (NaN if left out) in one replicate,
+    task = (kind, replicate number); see module docstring.
+    '''
+    kind, number = task
+    adj_ix = np.asarray(_SHARED["adj_ix"])
+    prenom = np.asarray(_SHARED["prenom"])
+    lengths = np.asarray(_SHARED["lengths"])
+    cell_cols = _SHARED["cell_cols"]
+    shape = _SHARED["shape"]
+    rng = np.random.default_rng([_SHARED["seed"], KINDS.index(kind), number])
+
+    weights = np.ones(len(adj_ix), dtype=np.int64)
+    if kind == "bootstrap":
+        weights = np.bincount(rng.integers(0, len(adj_ix), len(adj_ix)), minlength=len(adj_ix))
+    elif kind == "permutation":
+        prenom = shuffle_within(prenom, adj_ix, rng)
+
+    # adjectives with at least threshold instances in both positions
+    prenom_counts = np.bincount(adj_ix[prenom], weights=weights[prenom], minlength=shape[0])
+    postnom_counts = np.bincount(adj_ix[~prenom], weights=weights[~prenom], minlength=shape[0])
+    keep = np.flatnonzero((prenom_counts >= _SHARED["threshold"]) & (postnom_counts >= _SHARED["threshold"]))
+
+    sims = np.full(shape[0], np.nan)
+    if len(keep) == 0:
+        return sims
+    prenom_matrix, postnom_matrix = count_matrices(adj_ix, prenom, lengths, cell_cols, shape, weights)
+    cosines = embed_cosines(prenom_matrix[keep,:], postnom_matrix[keep,:], k=_SHARED["k"],
+                            seed=_SHARED["seed"], embedding=_SHARED["embedding"])
+    if cosines is not None:
+        sims[keep] = cosines
+
+    return sims
+
+
+def run_replicates(tasks, workers=1):
+    '''
+    Runs the replicates of tasks, in parallel if workers > 1.
+    Returns their cosine similarities as an array of shape (#tasks, #adjectives).
+    '''
+    if workers > 1 and len(tasks) > 1:
+        with multiprocessing.Pool(workers, initializer=load_shared, initargs=(_SHARED["directory"], _SHARED["settings"])) as pool:
+            results = pool.map(replicate, tasks, chunksize=max(1, len(tasks) // (workers * 4)))
+    else:
+        results = [replicate(task) for task in tasks]
+
+    return np.array(results).reshape(len(tasks), _SHARED["shape"][0])
+
+
+def percentile_intervals(samples, alpha=0.05):
+    '''
+    Percentile confidence interval (1-alpha) of every column of samples, ignoring
+    NaN. Columns without any value have NaN bounds.
+    '''
+    if len(samples) == 0:
+        return np.full(samples.shape[1], np.nan), np.full(samples.shape[1], np.nan)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning) # all-NaN columns
+        lower = np.nanpercentile(samples, 100 * alpha / 2, axis=0)
+        upper = np.nanpercentile(samples, 100 * (1 - alpha / 2), axis=0)
+
+    return lower, upper
+
+
+def permutation_pvalues(observed, null):
+    '''
+    One-sided p-value of every observed value (column of null):
+    (1 + #replicates at most as high) / (1 + #replicates), ignoring NaN.
+    '''
+    valid = ~np.isnan(null)
+    at_most = (null <= observed) & valid
+    counts = valid.sum(axis=0)
+    pvalues = np.full(len(observed), np.nan)
+    np.divide(1 + at_most.sum(axis=0), 1 + counts, out=pvalues, where=counts > 0)
+
+    return pvalues
+
+
+def resample_cosines(df, bootstrap=1000, permutations=0, threshold=2, k=128, seed=0,
+                     embedding="svd", alpha=0.05, workers=1, corpus=None):
+    '''
+    Observed cosine similarity of every adjective (as in generate_bow.bow_cosines()),
+    with a bootstrap confidence interval of bootstrap replicates and the
+    p-value of permutations replicates (see module docstring).
+    workers is the number of worker processes.
+
+    Returns a dataframe with columns adjective, cosine_similarity, ci_lower,
+    ci_upper, bootstrap_n (#replicates the adjective was in) and, with
+    permutations, p_value and permutation_n. Only the adjectives of the
+    observed cosines are kept, in row order.
+    '''
+    if corpus is None:
+        corpus = Corpus.from_df(df)
+    adj_dict, lexicon_dict = build_matrix(df, corpus)
+    arrays = cooccurrence_arrays(adj_dict, lexicon_dict, df, corpus)
+    settings = {"shape": (len(adj_dict), len(lexicon_dict)), "threshold": threshold, "k": k,
+                "seed": seed, "embedding": embedding}
+
+    with tempfile.TemporaryDirectory() as directory:
+        write_shared(directory, *arrays)
+        load_shared(directory, settings)
+        _SHARED["directory"] = directory
+        _SHARED["settings"] = settings
+        try:
+            observed = replicate(("observed", 0))
+            print(f"Running {bootstrap} bootstrap and {permutations} permutation replicates on {workers} worker(s)...")
+            boot = run_replicates([("bootstrap", n) for n in range(bootstrap)], workers)
+            null = run_replicates([("permutation", n) for n in range(permutations)], workers)
+        finally:
+            _SHARED.clear() # closes the memory maps
+
+    kept = np.flatnonzero(~np.isnan(observed))
+    adjectives = np.array(list(adj_dict.keys()), dtype=object)
+    lower, upper = percentile_intervals(boot, alpha)
+    table = pd.DataFrame({
+        "adjective": adjectives[kept],
+        "cosine_similarity": observed[kept],
+        "ci_lower": lower[kept],
+        "ci_upper": upper[kept],
+        "bootstrap_n": (~np.isnan(boot)).sum(axis=0)[kept],
+    })
+    if permutations:
+        table["p_value"] = permutation_pvalues(observed, null)[kept]
+        table["permutation_n"] = (~np.isnan(null)).sum(axis=0)[kept]
+
+    return table
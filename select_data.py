@@ -1,57 +1,82 @@
-from ast import literal_eval
-import pandas as pd
-import sys
+import numpy as np
 
+from corpus import Corpus
+from data_io import parse_list
+
+'''Find every occurrence of every sequence in a corpus (see corpus.Corpus),
+in one vectorized scan of its flat tag codes per sequence.
+Returns arrays of the row, sequence number and start position of every match,
+ordered by row, then sequence, then position.
 '''
-For every match of the sequence in the sentence tags,
-create a new row with additional info: matching tokens, lemmas, and target tags.
-Returns a list of these new rows.
-If there are no matches, an empty list is returned;
-multiple matches returns a list length = # of matches.
-'''
-def check_match(row,sequences,lang):
-    sentence = row["sentence"].split()
-    lemmas = row["lemmas"]
-    tags = row["POS_tags"]
-    # POS/lemma data loaded from .csv file and need to be converted back to list
-    if type(lemmas) != list:
-        lemmas = literal_eval(lemmas)
-        tags = literal_eval(tags)
-
-    matches = []    
-
-    # check all sequences
-    for seq in sequences:
-        # check tags
-        for i in range(len(tags)-len(seq)):
-            # subset of tags matches sequence
-            if tags[i:(i+len(seq))] == seq:
-                matching_row = row.copy()
-                if lang == 'ar':
-                    bw = row["BW"]
-                    if type(bw) != list:
-                        bw = literal_eval(bw)
-                    matching_row["target_tokens"] = bw[i:i+len(seq)]
-                else:
-                    matching_row["target_tokens"] = sentence[i:i+len(seq)]
-                matching_row["target_lemmas"] = lemmas[i:i+len(seq)]
-                matching_row["target_tags"] = tags[i:i+len(seq)]
-                matches.append(matching_row)
-
-    return matches
+def match_sequences(corpus, sequences):
+    codes = corpus.tags
+    rows = corpus.rows()
+    positions = corpus.positions()
+    match_rows = []
+    match_seqs = []
+    match_positions = []
+    for seq_num, seq in enumerate(sequences):
+        n_starts = len(codes) - len(seq) + 1
+        # a tag never seen in the corpus cannot match
+        if n_starts <= 0 or any(tag not in corpus.tag_vocab for tag in seq):
+            continue
+        # all tags equal and the whole sequence within one sentence
+        hits = rows[:n_starts] == rows[len(seq)-1:]
+        for j, tag in enumerate(seq):
+            hits &= codes[j:j+n_starts] == corpus.tag_vocab.get(tag)
+        starts = np.flatnonzero(hits)
+        match_rows.append(rows[starts])
+        match_seqs.append(np.full(len(starts), seq_num))
+        match_positions.append(positions[starts])
+
+    if not match_rows:
+        empty = np.array([], dtype=np.int64)
+        return empty, empty, empty
+
+    match_rows = np.concatenate(match_rows)
+    match_seqs = np.concatenate(match_seqs)
+    match_positions = np.concatenate(match_positions)
+    order = np.lexsort((match_positions, match_seqs, match_rows))
+
+    return match_rows[order], match_seqs[order], match_positions[order]
 
 
 '''Check POS tags of sentences in the input dataframe, output a new dataframe
 with only the rows that have a match. Multiple matches per sentence is
 possible, resulting df has one row for each unique match.
+Matches of every sequence, at every position of the sentence, are found for
+the whole dataframe at once, on its integer-coded corpus (see corpus.Corpus),
+built from its lemmas and POS_tags columns unless it is given.
+If the corpus is given without them in df (see corpus.iter_corpus()),
+the lemmas and POS tags of the matching rows are decoded from the corpus.
 '''
-def find_sequences(df,sequences,lang):
-    dataset = []
-    for index, row in df.iterrows():
-        matches = check_match(row,sequences,lang)
-        for row in matches:
-            dataset.append(row)
-        # progress check
-        if index%1000 == 0:
-            print('working on row ' + str(index))
-    return pd.DataFrame(dataset)
\ No newline at end of file
+def find_sequences(df,sequences,lang,corpus=None):
+    if corpus is None:
+        corpus = Corpus.from_df(df)
+    match_rows, match_seqs, match_positions = match_sequences(corpus, sequences)
+    print(f"Found {len(match_rows)} target sequences in {len(df)} sentences")
+
+    # one row per match
+    dataset = df.iloc[match_rows].copy()
+    if "lemmas" not in dataset.columns:
+        dataset["lemmas"] = corpus.lemma_lists(match_rows)
+        dataset["POS_tags"] = corpus.tag_lists(match_rows)
+        dataset = dataset[[col for col in corpus.columns if col in dataset.columns]]
+
+    # tokens, lemmas and tags of every match, gathered from the flat arrays
+    starts = corpus.offsets[match_rows] + match_positions
+    lengths = np.array([len(sequences[s]) for s in match_seqs], dtype=np.int64)
+    target_lemmas = np.empty(len(match_rows), dtype=object)
+    for n in np.unique(lengths):
+        selected = np.flatnonzero(lengths == n)
+        index = starts[selected][:, None] + np.arange(n)
+        target_lemmas[selected] = corpus.lemma_vocab.decode(corpus.lemmas[index]).tolist()
+    if lang == 'ar':
+        tokens = [parse_list(bw) for bw in df["BW"].values[match_rows]]
+    else:
+        tokens = [sentence.split() for sentence in df["sentence"].values[match_rows]]
+    dataset["target_tokens"] = [t[i:i+n] for t, i, n in zip(tokens, match_positions, lengths)]
+    dataset["target_lemmas"] = list(target_lemmas)
+    dataset["target_tags"] = [list(sequences[s]) for s in match_seqs]
+
+    return dataset
@@ -0,0 +1,199 @@
+'''
+Incremental update of a previous run for a new Common Voice release.
+
+Common Voice releases are cumulative: a new validated.tsv mostly repeats the
+previous one. Rows are matched by audio file (the path column):
+(1) rows of the new validated.tsv whose audio file was not tagged by the
+    previous run are written to a delta corpus,
+(2) only the delta goes through tag -> select -> pforms -> constraints,
+(3) the delta is merged with the previous tagged data and output; rows whose
+    audio file is no longer in validated.tsv are dropped,
+(4) relative_frequency of every row is recomputed from the maintained pair
+    counts (previous counts - dropped rows + delta), not from a full re-scan.
+
+The previous run must have written tagged_{lang} and output_{lang}
+(and pair_counts_{lang}; if missing, it is counted once from output_{lang}),
+with the same settings (tagger, lexicon, constraint file, ...): if they
+changed, the full pipeline is run instead.
+
+Used by main.py --previous.
+'''
+
+import os
+import pandas as pd
+
+from add_constraints import apply_pair_counts, combine_pair_counts, pair_counts
+from data_io import DataWriter, iter_data, read_data, write_data
+from pipeline import changed_settings, record_settings
+
+# stages the rows of the previous output went through,
+# whose settings must be the same for the new rows
+MERGED_STAGES = ["tag", "select", "pforms", "constraints"]
+
+
+def find_stage_file(directory, stem, lang):
+    '''
+    Path of a stage output {stem}_{lang} in directory, .parquet or .csv.
+    Returns None if there is none.
+    '''
+    for ext in ["parquet", "csv"]:
+        path = os.path.join(directory, f"{stem}_{lang}.{ext}")
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def read_audio_files(path):
+    '''
+    Set of the audio files of a dataset file (only its audio_file column is read).
+    '''
+    if path.endswith(".parquet"):
+        audio_files = pd.read_parquet(path, columns=["audio_file"])["audio_file"]
+    else:
+        audio_files = pd.read_csv(path, usecols=["audio_file"])["audio_file"]
+    return set(audio_files)
+
+
+def write_delta_corpus(corpus_path, delta_path, seen):
+    '''
+    Streams validated.tsv and writes the rows whose audio file is not in seen
+    to delta_path, in the same format.
+    Returns the set of all audio files in validated.tsv, and the number of
+    new rows.
+    '''
+    current = set()
+    new_rows = 0
+    with open(corpus_path, 'r', encoding='utf8') as corpus_file, open(delta_path, 'w', encoding='utf8') as delta_file:
+        delta_file.write(next(corpus_file, '')) # header
+        for line in corpus_file:
+            if not line.strip():
+                continue
+            audio_file = line.split('\t')[1].strip()
+            current.add(audio_file)
+            if audio_file not in seen:
+                delta_file.write(line)
+                new_rows += 1
+    return current, new_rows
+
+
+def merge_tagged(previous_path, delta_path, out_path, current, chunksize=100000):
+    '''
+    Writes the previous tagged data (rows still in the corpus), followed by
+    the tagged delta, to out_path, chunk by chunk.
+    '''
+    writer = DataWriter(out_path)
+    for chunk in iter_data(previous_path, chunksize=chunksize):
+        writer.write(chunk[chunk["audio_file"].isin(current)])
+    if delta_path is not None:
+        for chunk in iter_data(delta_path, chunksize=chunksize):
+            writer.write(chunk)
+    writer.close()
+
+
+def merge_output(previous_dir, delta_output_path, out_path, current, lang, fmt, chunksize=100000):
+    '''
+    Merges the previous output (rows still in the corpus) with the delta
+    output, and recomputes relative_frequency from the maintained pair counts.
+    Both outputs are streamed chunk by chunk, twice: once to count the pairs
+    of the dropped and new rows, once to write the merged rows.
+    Writes the merged output (and a .csv copy) and the updated pair counts.
+    Returns the updated pair counts.
+    '''
+    previous_path = find_stage_file(previous_dir, "output", lang)
+    counts_path = find_stage_file(previous_dir, "pair_counts", lang)
+    previous_counts = [read_data(counts_path)] if counts_path else []
+
+    # (1) pair counts of the dropped rows (and of all previous rows, if not written)
+    removed_counts = []
+    kept_rows = removed_rows = 0
+    for chunk in iter_data(previous_path, chunksize=chunksize):
+        kept = chunk["audio_file"].isin(current)
+        kept_rows += int(kept.sum())
+        removed_rows += int((~kept).sum())
+        if not kept.all():
+            removed_counts = [combine_pair_counts(*removed_counts, pair_counts(chunk[~kept].copy()))]
+        if not counts_path:
+            previous_counts = [combine_pair_counts(*previous_counts, pair_counts(chunk))]
+    delta_counts = []
+    if delta_output_path is not None:
+        for chunk in iter_data(delta_output_path, chunksize=chunksize):
+            delta_counts = [combine_pair_counts(*delta_counts, pair_counts(chunk))]
+    if previous_counts or delta_counts:
+        counts = combine_pair_counts(*previous_counts, *delta_counts,
+                                     subtract=removed_counts[0] if removed_counts else None)
+    else:
+        counts = pd.DataFrame(columns=["adj_lemma", "noun_lemma", "prenominal", "postnominal"])
+
+    # (2) merged rows, with relative frequencies from the updated counts
+    writer = DataWriter(out_path, csv_copy=True)
+    for chunk in iter_data(previous_path, chunksize=chunksize):
+        writer.write(apply_pair_counts(chunk[chunk["audio_file"].isin(current)].copy(), counts))
+    if delta_output_path is not None:
+        for chunk in iter_data(delta_output_path, chunksize=chunksize):
+            writer.write(apply_pair_counts(chunk, counts))
+    writer.close()
+
+    print(f"Kept {kept_rows} previous rows, dropped {removed_rows}, added {writer.rows - kept_rows}.")
+    write_data(counts, os.path.join(os.path.dirname(out_path), f"pair_counts_{lang}.{fmt}"))
+
+    return counts
+
+
+def run_update(args, stages, run_stages, corpus_path, lang, profiler=None):
+    '''
+    Runs the pipeline on the rows of corpus_path that are new since the
+    previous run in args.previous, and merges the results into args.outdir.
+    stages and run_stages are main.py's stage graph and runner
+    (profiler, if any, is passed on to run_stages).
+    If the settings of the stages up to the constraints (tagger, lexicon,
+    constraint file, ...) differ from those of the previous run, or the
+    previous run did not record them, its rows would not match the new ones:
+    the full pipeline is run on corpus_path instead.
+    '''
+    tagged_path = find_stage_file(args.previous, "tagged", lang)
+    if tagged_path is None or find_stage_file(args.previous, "output", lang) is None:
+        raise FileNotFoundError(f"No tagged_{lang} and output_{lang} in {args.previous} to update.")
+
+    changed = changed_settings(stages, MERGED_STAGES, args, lang, args.previous)
+    if changed:
+        print(f"Settings of stage(s) {', '.join(changed)} differ from (or were not recorded by) "
+              f"the previous run in {args.previous}, running the full pipeline instead.")
+        return run_stages(stages, ("ingest", corpus_path), args, lang, outdir=args.outdir, force=args.force, profiler=profiler)
+
+    # (1) new rows, by audio file
+    delta_dir = os.path.join(args.outdir, f"delta_{lang}")
+    os.makedirs(delta_dir, exist_ok=True)
+    delta_corpus = os.path.join(delta_dir, "validated.tsv")
+    current, new_rows = write_delta_corpus(corpus_path, delta_corpus, read_audio_files(tagged_path))
+    print(f"{new_rows} new rows out of {len(current)} in {corpus_path}")
+
+    # (2) pipeline on the delta only
+    paths = {}
+    if new_rows:
+        paths = run_stages(stages, ("ingest", delta_corpus), args, lang, outdir=delta_dir, force=args.force, profiler=profiler)
+
+    # (3-4) merge, written to temporary files first, as outdir may be args.previous
+    tagged_out = os.path.join(args.outdir, f"tagged_{lang}.{args.format}")
+    output_out = os.path.join(args.outdir, f"output_{lang}.{args.format}")
+    tagged_tmp = os.path.join(args.outdir, f"tagged_{lang}.new.{args.format}")
+    output_tmp = os.path.join(args.outdir, f"output_{lang}.new.{args.format}")
+    merge_tagged(tagged_path, paths.get("tag"), tagged_tmp, current, chunksize=args.chunksize)
+    merge_output(args.previous, paths.get("constraints"), output_tmp, current, lang, args.format,
+                 chunksize=args.chunksize)
+    os.replace(tagged_tmp, tagged_out)
+    os.replace(output_tmp, output_out)
+    output_csv_tmp = os.path.splitext(output_tmp)[0] + ".csv"
+    if os.path.exists(output_csv_tmp) and output_csv_tmp != output_tmp:
+        os.replace(output_csv_tmp, os.path.splitext(output_out)[0] + ".csv")
+    record_settings(stages, MERGED_STAGES, args, lang, args.outdir, {"tag": tagged_out, "constraints": output_out})
+
+    paths = {"tag": tagged_out, "constraints": output_out}
+
+    # flexibility and random effects of the merged output, by their stages
+    # (see flexibility.py and add_randomeffects.py)
+    for stage in stages:
+        if stage.upstream == "constraints" and stage.enabled(args):
+            paths[stage.name] = os.path.join(args.outdir, f"{stage.output}_{lang}.{args.format}")
+            stage.run(output_out, paths[stage.name], args, lang)
+
+    return paths